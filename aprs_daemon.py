@@ -1,68 +1,268 @@
 #! /usr/bin/python
 """APRS daemon"""
+import os
 import threading
 import subprocess
 import re
+import select
 import time
-from math import sin, cos, acos, atan2, degrees
 
 # Simulation and data storage
 import numpy as np
-import pyBalloon.pyb_io
-import pyBalloon.pyb_traj
+from flight_store import FlightStore
+from history import HistoryTiers
+from geodesy import derive_speeds, flight_speeds, haversine, \
+                    initial_bearing
+from replay import ReplaySource, REALTIME
+from gfs_cache import GfsCache
+from log_writer import LogWriterThread
+from flight_log import FlightLog
+from gps_reader import GpsReaderThread, CHASE_COLUMNS
+from importtime import lazy_import
+from latency import LatencyMonitor
+from trajectory_export import write_kml
+from descent import DescentPredictor
+from ensemble_stats import LandingStatistics
 
-# SRD
-#from rtlsdr import *
-from libfap.libfap import libfap, fapLOCATION
-
-#GPS
-import pynmea2
-
-# RS232
-import serial
+# pyBalloon, prediction, libfap and serial are imported on first
+# use, so disabled features cost no startup time
+import aprs_parser
 
 SDR, RS232, FILE = range(3)
 
+# AX.25 callsign with optional SSID, required of callsigns tracked unlisted
+CALLSIGN_RE = re.compile(r'^[A-Z0-9]{1,6}(-[A-Z0-9]{1,2})?$')
+
 def distance(lat0, lon0, lat1, lon1):
-    """Calculate distance between two locations"""
-    return acos(sin(lat0)*sin(lat1) + cos(lat0)*cos(lat1) * \
-           cos(lon1 - lon0)) * 6371
+    """Calculate distance in metres between two locations"""
+    return float(haversine(lat0, lon0, lat1, lon1))
 
 def direction(lat0, lon0, lat1, lon1):
-    """Calculate compass heading of target"""
-    ydir = sin(lon1 - lon0) * cos(lat1)
-    xdir = cos(lat0)*sin(lat1) - sin(lat0)*cos(lat1)*cos(lon1 - lon0)
-    bearing = degrees(-atan2(ydir, xdir))
-    return (bearing+360) % 360
-
-#LIVE_DATA = {
-    #'timestamps':  np.array([]),
-    #'lats':  np.array([]),
-    #'lons':  np.array([]),
-    #'pressures': np.array([]),
-    #'altitudes':  np.array([]),
-    #'temperatures': np.array([]),
-    #'horizontal_speed': np.array([]),
-    #'vertical_speed': np.array([]),
-#}
-
-LIVE_DATA = {
-    'timestamps': [],
-    'lats': [],
-    'lons': [],
-    'pressures': [],
-    'altitudes': [],
-    'temperatures': [],
-    'horizontal_speed': [],
-    'vertical_speed': [],
-}
+    """Calculate bearing of target, degrees clockwise from north"""
+    return float(initial_bearing(lat0, lon0, lat1, lon1))
+
+def recompute_speeds(store):
+    """Recompute speeds of a whole stored flight in one vectorized pass"""
+    horizontal, vertical = flight_speeds(store['timestamps'], store['lats'],
+                                         store['lons'], store['altitudes'])
+    store.set_column('horizontal_speed', horizontal)
+    store.set_column('vertical_speed', vertical)
+
+LIVE_DATA = FlightStore()
+LIVE_HISTORY = HistoryTiers()
+CHASE_DATA = FlightStore(CHASE_COLUMNS)
+
+def target_file_name(fname, callsign):
+    """Derive per-callsign log file name from a shared one"""
+    root, ext = os.path.splitext(fname)
+    return ''.join([root, '_', callsign.replace('/', '_'), ext])
+
+class Target(object):
+    """Tracked callsign with its own flight store, history and log files"""
+    def __init__(self, callsign, store, history=None):
+        """Initialise target"""
+        self.callsign = callsign
+        self.store = store
+        if history is None:
+            history = HistoryTiers()
+        self.history = history
+        self.writer = None
+        self.log = None
+
+    def open(self, writer, data_file, raw_file, log_file, resume=False,
+             time0=None):
+        """Open log files of target in log writer
+
+        With resume, a flight found in the binary log is loaded into an
+        empty store, rolling its older rows into the history, and all log
+        files are appended to.  Returns time0 of the loaded flight, None
+        if nothing was loaded.
+        """
+        self.writer = writer
+        self.log = FlightLog(log_file)
+        restored = None
+        append = resume and self.log.repair()
+        if append and len(self.store) == 0:
+            time0, rows = self.log.load(time0)
+            if len(rows['timestamps']) > 0:
+                self.store.extend(rows)
+                recompute_speeds(self.store)
+                self.history.clear()
+                self.history.retain(self.store)
+                restored = time0
+        mode = 'a' if append else 'w'
+        writer.open_file((self.callsign, 'data'), data_file, mode)
+        writer.open_file((self.callsign, 'raw'), raw_file, mode)
+        writer.open_file((self.callsign, 'log'), log_file, mode + 'b')
+        if not append:
+            writer.write((self.callsign, 'log'), self.log.header())
+        return restored
+
+    def close(self):
+        """Close log files of target"""
+        if self.writer is not None:
+            self.writer.close_file((self.callsign, 'data'))
+            self.writer.close_file((self.callsign, 'raw'))
+            self.writer.close_file((self.callsign, 'log'))
+        self.writer = None
+
+    def write_data(self, line):
+        """Queue line for parsed data log"""
+        if self.writer is not None:
+            self.writer.write((self.callsign, 'data'), line)
+
+    def write_raw(self, line):
+        """Queue line for raw data log"""
+        if self.writer is not None:
+            self.writer.write((self.callsign, 'raw'), line)
+
+    def write_log(self, rows, time0):
+        """Queue rows with times since time0 for binary log"""
+        if self.writer is not None:
+            self.writer.write((self.callsign, 'log'),
+                              self.log.encode(rows, time0))
+
+class TargetRegistry(object):
+    """Hash-indexed registry of tracked callsigns
+
+    The primary callsign is always stored in LIVE_DATA and LIVE_HISTORY.
+    In multi-target mode every other callsign listed in
+    PARAMETERS['callsigns'] gets its own FlightStore, history and log
+    files the first time a position of it is received.  If the list is
+    empty, callsigns heard are tracked up to PARAMETERS['max_targets']
+    targets, and only if they are valid AX.25 callsigns, so corrupted
+    frames and busy frequencies cannot exhaust memory and file handles.
+    """
+    def __init__(self, primary_store, primary_history):
+        """Initialise registry"""
+        self.primary_store = primary_store
+        self.primary_history = primary_history
+        self.targets = {}
+        self.writer = None
+        self.primary = None
+        self.accepted = None
+        self.version = 0
+        self.time0 = None
+        self._open = False
+
+    def __getitem__(self, callsign):
+        """Get target by callsign"""
+        return self.targets[callsign]
+
+    def __contains__(self, callsign):
+        """Check if callsign is tracked"""
+        return callsign in self.targets
+
+    def __len__(self):
+        """Number of tracked callsigns"""
+        return len(self.targets)
+
+    def callsigns(self):
+        """Tracked callsigns"""
+        return self.targets.keys()
+
+    def open(self, writer, time0=None):
+        """Configure registry from PARAMETERS and open primary target
+
+        time0 is the time origin of new flights.  Returns time0 of a
+        flight resumed from the binary log, None if no flight was loaded.
+        """
+        self.close()
+        self.writer = writer
+        primary = PARAMETERS['callsign']
+        for callsign in self.targets.keys():
+            if self.targets[callsign].store is self.primary_store and \
+               callsign != primary:
+                del self.targets[callsign]
+        if primary not in self.targets or \
+           self.targets[primary].store is not self.primary_store:
+            self.targets[primary] = Target(primary, self.primary_store,
+                                           self.primary_history)
+        self.primary = primary
+        self.targets[primary].history.window = PARAMETERS['history_window']
+        restored = self.targets[primary].open(writer,
+                                              PARAMETERS['data_file'],
+                                              PARAMETERS['raw_file'],
+                                              PARAMETERS['flight_log'],
+                                              PARAMETERS['flight_log_resume'])
+        self.time0 = time0 if restored is None else restored
+        if restored is not None:
+            self.version += 1
+        self.accepted = None
+        if PARAMETERS['multi_target']:
+            self.accepted = set(callsign.strip() for callsign in
+                                str(PARAMETERS['callsigns']).split(',')
+                                if callsign.strip() != '')
+        self._open = True
+        return restored
+
+    def close(self):
+        """Close log files of all targets"""
+        for target in self.targets.itervalues():
+            target.close()
+        self._open = False
+
+    def accepts(self, callsign):
+        """Check cheaply if packets of callsign should be decoded"""
+        if callsign == self.primary:
+            return True
+        if self.accepted is None or callsign is None:
+            return False
+        if len(self.accepted) > 0:
+            return callsign in self.accepted
+        return callsign in self.targets or self._trackable(callsign)
+
+    def _trackable(self, callsign):
+        """Check if an unlisted callsign may get a new target"""
+        return len(self.targets) < PARAMETERS['max_targets'] and \
+               CALLSIGN_RE.match(callsign) is not None
+
+    def lookup(self, callsign):
+        """Get target for callsign, creating it if it should be tracked"""
+        if callsign != self.primary and self.accepted is None:
+            return None
+        target = self.targets.get(callsign)
+        if target is not None:
+            if target.writer is None and self._open:
+                self._open_target(target)
+            return target
+        if self.accepted is None or not self._open:
+            return None
+        if len(self.accepted) > 0:
+            if callsign not in self.accepted:
+                return None
+        elif not self._trackable(callsign):
+            return None
+        target = Target(callsign, FlightStore())
+        self._open_target(target)
+        self.targets[callsign] = target
+        return target
+
+    def _open_target(self, target):
+        """Open per-callsign log files of a secondary target"""
+        target.history.window = PARAMETERS['history_window']
+        target.open(self.writer,
+                    target_file_name(PARAMETERS['data_file'],
+                                     target.callsign),
+                    target_file_name(PARAMETERS['raw_file'],
+                                     target.callsign),
+                    target_file_name(PARAMETERS['flight_log'],
+                                     target.callsign),
+                    PARAMETERS['flight_log_resume'], self.time0)
+
+TARGETS = TargetRegistry(LIVE_DATA, LIVE_HISTORY)
 
 # parameters
 PARAMETERS = {
     'aprs_source':                 0,
     'aprs_file':                   "",
+    'replay_mode':                 REALTIME,
+    'replay_speed':                1.0,
     'update_interval':             1,
     'callsign':                    "",
+    'multi_target':                False,
+    'callsigns':                   "",
+    'max_targets':                 16,
     'sdr_freq':                    144.8,
     'sdr_rate':                    22050,
     'sdr_gain':                    4,
@@ -79,9 +279,27 @@ PARAMETERS = {
     'sdr_serial_interchartimeout': None,
     'raw_file':                    "/tmp/raw_data.dat",
     'data_file':                   "/tmp/live_data.dat",
+    'flight_log':                  "/tmp/flight_log.bin",
+    'flight_log_resume':           False,
+    'history_window':              7200.0,
+    'log_queue_size':              10000,
+    'log_flush_interval':          1.0,
+    'log_flush_records':           100,
+    'log_fsync':                   False,
     'simulate':                    False,
     'gfs_dir':                     "/tmp/gfs",
+    'gfs_cache_dir':               "/tmp/gfs_cache",
+    'gfs_cache_size':              2048,
     'kml_file':                    "/tmp/pyballoon_trajectories.kml",
+    'kml_export':                  False,
+    'prediction_workers':          0,
+    'prediction_interval':         10.0,
+    'descent_predictor':           True,
+    'descent_band':                500.0,
+    'plot_blit':                   True,
+    'latency_file':                "/tmp/latency.json",
+    'stream_host':                 "127.0.0.1",
+    'stream_port':                 8765,
     'gps':                         False,
     'gps_serial_port':             0,
     'gps_serial_rate':             9600,
@@ -115,17 +333,24 @@ BALLOON = {
 
 class DataCollectorThread(threading.Thread):
     """Thread for collecting data"""
-    def __init__(self, aprs_data_handler, gps_data_handler):
+    def __init__(self, aprs_batch_handler, latency=None):
         """Initialise datacollector thread"""
         threading.Thread.__init__(self, name='DataCollectorThread')
-        self._running = False
+        # cleared by exit(), which may come before run()
+        self._running = True
         self.start_frame_re = re.compile(r'^APRS: (.*)')
-        self.aprs_data_handler = aprs_data_handler
-        self.gps_data_handler = gps_data_handler
+        self.aprs_batch_handler = aprs_batch_handler
         self.subprocs = {}
         self.filep = None
         self.sdr_ser = None
-        self.gps_ser = None
+        self.replay = None
+        self.latency = latency
+        self._frames = []
+        self._frame_times = []
+        self._packet_times = []
+        self._read_time = None
+        self._wake_r = None
+        self._wake_w = None
 
     def is_active(self):
         """Check if thread is active"""
@@ -153,6 +378,7 @@ class DataCollectorThread(threading.Thread):
                 print "SDR: OSError"
                 self._running = False
         elif PARAMETERS['aprs_source'] == RS232:
+            serial = lazy_import('serial', 'serial')
             try:
                 self.sdr_ser = serial.Serial(PARAMETERS['sdr_serial_port'],
                                 PARAMETERS['sdr_serial_rate'],
@@ -176,82 +402,145 @@ class DataCollectorThread(threading.Thread):
                 self._running = False
         if self._running == False:
             print "APRS source failed, stopping data collector"
-            
-        if PARAMETERS['gps']:
-            try:
-                self.gps_ser = serial.Serial(PARAMETERS['gps_serial_port'],
-                                PARAMETERS['gps_serial_rate'],
-                                PARAMETERS['gps_serial_bytesize'],
-                                PARAMETERS['gps_serial_parity'],
-                                PARAMETERS['gps_serial_stopbits'],
-                                PARAMETERS['gps_serial_timeout'],
-                                PARAMETERS['gps_serial_xonxoff'],
-                                PARAMETERS['gps_serial_rtscts'],
-                                PARAMETERS['gps_serial_writetimeout'],
-                                PARAMETERS['gps_serial_dsrdtr'],
-                                PARAMETERS['gps_serial_interchartimeout'])
-            except serial.SerialException:
-                print "GPS: SerialException"
-                print "Opening GPS failed, disabling"
-                PARAMETERS['gps'] = 0
 
     def exit(self):
         """Dispose thread"""
         self._running = False
+        self._wake()
+
+    def _wake(self):
+        """Interrupt select loop"""
+        try:
+            os.write(self._wake_w, 'x')
+        except (OSError, TypeError):
+            pass
+
+    def _close_process(self):
+        """Close background processes and ports"""
         if PARAMETERS['aprs_source'] == SDR:
             for name in ['mm', 'rtl_fm']:
                 try:
                     proc = self.subprocs[name]
                     proc.terminate()
-                except OSError:
+                except (OSError, KeyError):
                     print "OSError"
         elif PARAMETERS['aprs_source'] == RS232:
+            serial = lazy_import('serial', 'serial')
             try:
-                self.sdr_ser.close()
+                if self.sdr_ser is not None:
+                    self.sdr_ser.close()
             except serial.SerialException:
                 pass
         else: #data from file
             try:
-                self.filep.close()
+                if self.filep is not None:
+                    self.filep.close()
             except IOError:
                 print "IO error"
-        if PARAMETERS['gps']:
+        wake_r, wake_w = self._wake_r, self._wake_w
+        self._wake_r = self._wake_w = None
+        for fd in [wake_r, wake_w]:
             try:
-                self.gps_ser.close()
-            except serial.SerialException:
-                print "SerialException"
+                os.close(fd)
+            except OSError:
+                pass
+
+    def _sources(self):
+        """Map selectable file descriptors to their line handlers"""
+        sources = {}
+        if PARAMETERS['aprs_source'] == SDR and 'mm' in self.subprocs:
+            sources[self.subprocs['mm'].stdout.fileno()] = \
+                self._handle_aprs_line
+        elif PARAMETERS['aprs_source'] == RS232 and self.sdr_ser is not None:
+            sources[self.sdr_ser.fileno()] = self._handle_aprs_line
+        return sources
+
+    def _handle_aprs_line(self, aprs_line):
+        """Queue TNC2 frame of an APRS line for the data handler"""
+        m = self.start_frame_re.match(aprs_line.strip())
+        if m:
+            self._frames.append(m.group(1))
+            self._frame_times.append(self._read_time)
+            self._packet_times.append(None)
+
+    def _replay_file(self):
+        """Pass due frames of APRS file to data handler"""
+        frames, stamps = self.replay.due_frames()
+        self._frames.extend(frames)
+        self._frame_times.extend([time.time()] * len(frames))
+        self._packet_times.extend(stamps)
+        self._flush_frames()
+        if self.replay.finished:
+            print self.replay.report()
+            return False
+        return True
+
+    def _flush_frames(self):
+        """Pass queued TNC2 frames, read and packet times to data handler"""
+        if len(self._frames) > 0:
+            frames, times = self._frames, self._frame_times
+            stamps = self._packet_times
+            self._frames = []
+            self._frame_times = []
+            self._packet_times = []
+            if self.latency is not None:
+                self.latency.add('collect', time.time() - np.array(times))
+            self.aprs_batch_handler(frames, times, stamps)
 
     def run(self):
-        """Run thread"""
+        """Run thread
+
+        All sources are multiplexed with select: pipe and serial input is
+        drained as soon as it is readable and split into lines, and the
+        frames read in one round are handed over as a single batch.  File
+        input is paced by ReplaySource.  exit() writes to a wake-up pipe
+        so stopping does not wait for input or for the replay pacing.
+        """
         print '', self.name, 'started.'
-        self._running = True
+        self._wake_r, self._wake_w = os.pipe()
         self._init_process()
+        sources = self._sources()
+        buffers = dict((fd, '') for fd in sources)
+        from_file = PARAMETERS['aprs_source'] == FILE and \
+                    self.filep is not None
+        if from_file:
+            self.replay = ReplaySource(self.filep,
+                                       PARAMETERS['replay_mode'],
+                                       PARAMETERS['replay_speed'])
         while self._running:
-            if PARAMETERS['aprs_source'] == SDR:
+            timeout = None
+            if from_file:
+                timeout = self.replay.timeout()
+            try:
+                readable = select.select(sources.keys() + [self._wake_r],
+                                         [], [], timeout)[0]
+            except (select.error, ValueError):
+                print "Select error"
+                break
+            for fd in readable:
+                if fd == self._wake_r:
+                    os.read(fd, 512)
+                    continue
                 try:
-                    aprs_line = self.subprocs['mm'].stdout.readline()
+                    data = os.read(fd, 4096)
                 except OSError:
                     print "OSError"
-            elif PARAMETERS['aprs_source'] == RS232:
-                aprs_line = self.sdr_ser.readline()
-            else: #data from file
-                try:
-                    aprs_line = self.filep.readline()
-                except IOError:
-                    print "IO error"
-            if PARAMETERS['gps']:
-                try:
-                    gps_line = self.gps_ser.readline()
-                except serial.SerialException:
-                    print "SerialException"
-            if aprs_line != '':
-                tnc2_frame = aprs_line.strip()
-                m = self.start_frame_re.match(tnc2_frame)
-                if m:
-                    self.aprs_data_handler(tnc2_frame)
-            if PARAMETERS['gps'] and gps_line != '':
-                self.gps_data_handler(gps_line)
-            time.sleep(PARAMETERS['update_interval'])
+                    data = ''
+                if data == '':
+                    # end of stream
+                    del sources[fd]
+                    del buffers[fd]
+                    continue
+                self._read_time = time.time()
+                lines = (buffers[fd] + data).split('\n')
+                buffers[fd] = lines.pop()
+                for line in lines:
+                    sources[fd](line)
+            self._flush_frames()
+            if from_file:
+                from_file = self._replay_file()
+        self._running = False
+        self._close_process()
         print '', self.name, 'ended.'
 
 class DataHandlerThread(threading.Thread):
@@ -267,28 +556,63 @@ class DataHandlerThread(threading.Thread):
         self.loc = {'lat': BALLOON['lat0'],
                     'lon': BALLOON['lon0'],
                     'alt': BALLOON['alt0']}
-        self.datacollector = DataCollectorThread(self.handle_aprs_data,
-                                                 self.handle_gps_data)
+        self.latency = LatencyMonitor()
+        self.datacollector = DataCollectorThread(self.handle_aprs_batch,
+                                                 self.latency)
+        self.gpsreader = None
+        self.descent = DescentPredictor(PARAMETERS['descent_band'],
+                                        BALLOON['alt0'])
+        self.landing = None
+        self.ensemble = None
         self.model_data = None
-        libfap.fap_init()
-        try:
-            self.datafile = open(PARAMETERS['data_file'], 'w')
-            self.rawfile = open(PARAMETERS['raw_file'], 'w')
-        except IOError:
-            print "Unable to open data file(s)"
+        self.predictor = None
+        self.scheduler = None
+        self.targets = TARGETS
+        self._file_time0 = None
+        # packet time of a replay plus this is UNIX time
+        self._replay_base = None
+        # oldest read time of stored data not yet seen by run loop
+        self._pending_read = None
+        self.read_time = None
+        # started by run(), a handler which is never run leaves no thread
+        self.logwriter = LogWriterThread(PARAMETERS['log_queue_size'],
+                                         PARAMETERS['log_flush_interval'],
+                                         PARAMETERS['log_flush_records'],
+                                         PARAMETERS['log_fsync'])
 
     def exit(self):
-        """Dispose thread"""
+        """Dispose thread
+
+        Does not wait for a running prediction, closing the executor ends
+        it.  The lock orders exit() with the start-up in run(), so threads
+        started there are either seen here or never started.
+        """
+        self.lock.acquire()
         self._running = False
-        if self.datacollector.is_active():
+        scheduler, self.scheduler = self.scheduler, None
+        predictor, self.predictor = self.predictor, None
+        self.lock.release()
+        if scheduler is not None:
+            scheduler.exit()
+        if predictor is not None:
+            predictor.close()
+        if self.datacollector.is_alive():
             self.datacollector.exit()
             self.datacollector.join()
-        libfap.fap_cleanup()
-        try:
-            self.rawfile.close()
-            self.datafile.close()
-        except IOError:
-            print "Unable to close data file(s)"
+        if self.gpsreader is not None:
+            self.gpsreader.exit()
+            self.gpsreader.join()
+            self.gpsreader = None
+        aprs_parser.cleanup_libfap()
+        self.targets.close()
+        if self.logwriter.is_alive():
+            self.logwriter.exit()
+            self.logwriter.join()
+            print "Log writer: %(records)d records, " \
+                  "queue depth %(queue_depth)d, " \
+                  "latency mean %(latency_mean).4f s " \
+                  "max %(latency_max).4f s" % self.logwriter.stats()
+        self.latency.dump(PARAMETERS['latency_file'])
 
     def is_active(self):
         """Check if thread is active"""
@@ -302,130 +626,321 @@ class DataHandlerThread(threading.Thread):
         self.loc['lat'] = BALLOON['lat0']
         self.loc['lon'] = BALLOON['lon0']
         self.loc['alt'] = BALLOON['alt0']
-        self.model_data = pyBalloon.pyb_io.read_gfs_set(PARAMETERS['gfs_dir'],
-                            (BALLOON['lat0']+1.5, BALLOON['lon0']-1.5,
-                            BALLOON['lat0']-1.5, BALLOON['lon0']+1.5))
-        self._calculate_trajectories()
+        pyb_io = lazy_import('pyBalloon.pyb_io', 'simulation')
+        prediction = lazy_import('prediction', 'simulation')
+        bbox = (BALLOON['lat0']+1.5, BALLOON['lon0']-1.5,
+                BALLOON['lat0']-1.5, BALLOON['lon0']+1.5)
+        if PARAMETERS['gfs_cache_size'] > 0:
+            cache = GfsCache(PARAMETERS['gfs_cache_dir'],
+                             PARAMETERS['gfs_cache_size'] * 1024**2)
+            self.model_data = cache.load(PARAMETERS['gfs_dir'], bbox,
+                                         pyb_io.read_gfs_set)
+        else:
+            self.model_data = pyb_io.read_gfs_set(PARAMETERS['gfs_dir'],
+                                                  bbox)
+        self.lock.acquire()
+        # nothing to start if exit() came while GFS data was loading
+        if self._running:
+            self.predictor = prediction.PredictionExecutor(
+                self.model_data, PARAMETERS['prediction_workers'])
+            self.scheduler = prediction.PredictionScheduler(
+                self._predict, PARAMETERS['prediction_interval'])
+            self.scheduler.start()
+            self._calculate_trajectories()
+        self.lock.release()
 
     def run(self):
-        """Run thread"""
+        """Run thread
+
+        New data only triggers a prediction request, the ensemble itself
+        runs in the PredictionScheduler thread without holding the lock.
+        The newest location is read from a LIVE_DATA snapshot, so the lock
+        is only held by writers and briefly to take the read time of the
+        new data for latency statistics.
+        """
         print '', self.name, 'started.'
+        self._running = True
         if PARAMETERS['simulate']:
             self._init_simulation()
-        self._running = True
+        self.lock.acquire()
+        if not self._running:
+            # exit() came while GFS data was loading
+            self.lock.release()
+            print '', self.name, 'ended.'
+            return
+        self.logwriter.start()
         self.time0 = time.time()
-        old_size = 0
+        old_version = self.targets.version
+        time0 = self.targets.open(self.logwriter, self.time0)
+        if time0 is not None:
+            # continue resumed flight on its own time axis
+            self.time0 = time0
+            self._file_time0 = time0
+        self._init_descent()
         if not self.datacollector.is_alive():
-            self.datacollector = DataCollectorThread(self.handle_aprs_data,
-                                                     self.handle_gps_data)
+            self.datacollector = DataCollectorThread(self.handle_aprs_batch,
+                                                     self.latency)
         self.datacollector.start()
+        # fixes of an earlier run must not stand in for the chase vehicle
+        CHASE_DATA.clear()
+        if PARAMETERS['gps']:
+            self.gpsreader = GpsReaderThread(CHASE_DATA, [
+                PARAMETERS['gps_serial_port'],
+                PARAMETERS['gps_serial_rate'],
+                PARAMETERS['gps_serial_bytesize'],
+                PARAMETERS['gps_serial_parity'],
+                PARAMETERS['gps_serial_stopbits'],
+                PARAMETERS['gps_serial_timeout'],
+                PARAMETERS['gps_serial_xonxoff'],
+                PARAMETERS['gps_serial_rtscts'],
+                PARAMETERS['gps_serial_writetimeout'],
+                PARAMETERS['gps_serial_dsrdtr'],
+                PARAMETERS['gps_serial_interchartimeout']])
+            self.gpsreader.start()
+        self.lock.release()
+        chase_version = CHASE_DATA.version
         while self._running:
-            self.lock.acquire()
+            loc1 = None
             # check if we have new data
-            if len(LIVE_DATA['timestamps']) > old_size:
-                if PARAMETERS['simulate']:
-                    self._update_trajectories()
+            new_data = self.targets.version != old_version
+            if new_data:
+                old_version = self.targets.version
+                self.lock.acquire()
+                read_time, self._pending_read = self._pending_read, None
+                self.lock.release()
+                if read_time is not None:
+                    self.read_time = read_time
+                    self.latency.add('handle', time.time() - read_time)
+                data = LIVE_DATA.snapshot()
+                if len(data) > 0:
+                    loc1 = (data['lats'][-1], data['lons'][-1],
+                            data['altitudes'][-1])
+            if new_data:
+                if loc1 is not None and self.scheduler is not None:
+                    self._update_trajectories(loc1)
+            # new chase vehicle fixes alone also refresh the display
+            if new_data or CHASE_DATA.version != chase_version:
+                chase_version = CHASE_DATA.version
                 self.master.update_data()
-                old_size = len(LIVE_DATA['timestamps'])
-            self.lock.release()
             time.sleep(PARAMETERS['update_interval'])
         print '', self.name, 'ended.'
 
-    def handle_aprs_data(self, tnc2_frame):
-        """Handle APRS data from data collector thread"""
-        print "handle_aprs_data"
-        packet = libfap.fap_parseaprs(tnc2_frame, len(tnc2_frame), 0)
-        # handle location data
-        if packet[0].type[0] == fapLOCATION.value:
-            if packet[0].src_callsign == PARAMETERS['callsign']:
-                self.lock.acquire()
-                if PARAMETERS['aprs_source'] == FILE:
-                    if len(LIVE_DATA['timestamps']) == 0:
-                        self.time0 = packet[0].timestamp[0]
-                    LIVE_DATA['timestamps'].append(packet[0].timestamp[0] - \
-                                                   self.time0)
-                else:
-                    LIVE_DATA['timestamps'].append(time.time() - self.time0)
-                LIVE_DATA['lats'].append(packet[0].latitude[0])
-                LIVE_DATA['lons'].append(packet[0].longitude[0])
-                LIVE_DATA['altitudes'].append(packet[0].altitude[0])
-                #FIXME temperatures
-                LIVE_DATA['temperatures'].append(0)
-                if len(LIVE_DATA['timestamps']) > 1:
-                    horizontal = distance(LIVE_DATA['lats'][-2],
-                                          LIVE_DATA['lons'][-2],
-                                          LIVE_DATA['lats'][-1],
-                                          LIVE_DATA['lons'][-1]) / \
-                                          (LIVE_DATA['timestamps'][-1] - \
-                                           LIVE_DATA['timestamps'][-2])
-                    vertical = (LIVE_DATA['altitudes'][-1] - \
-                                LIVE_DATA['altitudes'][-2]) / \
-                                (LIVE_DATA['timestamps'][-1] - \
-                                LIVE_DATA['timestamps'][-2])
-                    LIVE_DATA['horizontal_speed'].append(horizontal)
-                    LIVE_DATA['vertical_speed'].append(vertical)
-                    if len(LIVE_DATA['timestamps']) == 2:
-                        LIVE_DATA['horizontal_speed'][0] = horizontal
-                        LIVE_DATA['vertical_speed'][0] = vertical
-                else:
-                    LIVE_DATA['horizontal_speed'].append(0)
-                    LIVE_DATA['vertical_speed'].append(0)
-                #
-                # are these always available? what else?
-                # dynamic selection?
-                #
-                #np.append(LIVE_DATA['pressures'],
-                #          packet[0].wx_report.pressure)
-                #np.append(LIVE_DATA['temperatures'],
-                #          packet[0].wx_report.temp)
-                try:
-                    self.rawfile.write(''.join([tnc2_frame, '\n']))
-                    self.datafile.write(''.join([str(time.time()-self.time0),
-                                        ',', str(packet[0].latitude[0]),
-                                        ',', str(packet[0].longitude[0]),
-                                        ',', str(packet[0].altitude[0]),
-                                        #FIXME extra data
-                                        #packet[0].wx_report.pressure,
-                                        #',', packet[0].wx_report.temp,
-                                        '\n']))
-                except IOError:
-                    print "IO error"
-                self.lock.release()
-        libfap.fap_free(packet)
-
-    def handle_gps_data(self, nmea_sentence):
-        """Handle GPS data from data collector thread"""
-        nmea = pynmea2.NMEASentence.parse(nmea_sentence)
-        # handle location data
-        if nmea.sentence_type == pynmea2.GGA:
-            if nmea['gps_qual'] != 0:
-                print "location obtained", nmea['lat'], \
-                      ",", nmea['lon'], " @", nmea['altitude']
-                self.lock.acquire()
-                self.loc['lat'] = nmea['lat']
-                self.loc['lon'] = nmea['lon']
-                self.loc['alt'] = nmea['altitude']
-                self.lock.release()
+    def handle_aprs_batch(self, frames, read_times=None, packet_times=None):
+        """Handle a batch of TNC2 frames or decoded Positions
+
+        Frames are filtered and decoded without holding the lock, after
+        which the positions of each target are committed with vectorized
+        speed derivation in a single critical section.  read_times are
+        the times the frames were read, for latency statistics, and
+        packet_times the times a replay resolved for them.
+        """
+        if read_times is None:
+            read_times = [time.time()] * len(frames)
+        if packet_times is None:
+            packet_times = [None] * len(frames)
+        batches = {}
+        stored = []
+        decode_times = []
+        for frame, read_time, packet_time in zip(frames, read_times,
+                                                 packet_times):
+            start = time.time()
+            entry = self._decode_frame(frame, packet_time)
+            decode_times.append(time.time() - start)
+            if entry is None:
+                continue
+            target = entry[0]
+            if target.callsign not in batches:
+                batches[target.callsign] = (target, [], [])
+            batches[target.callsign][1].append(entry[1:])
+            batches[target.callsign][2].append(frame)
+            stored.append(read_time)
+        self.latency.add('decode', decode_times)
+        if len(batches) == 0:
+            return
+        rows = {}
+        wait = time.time()
+        self.lock.acquire()
+        self.latency.add('lock', time.time() - wait)
+        for target, entries, _ in batches.itervalues():
+            rows[target.callsign] = self._store_positions(target, entries)
+        self._mark_stored(stored)
+        self.lock.release()
+        for target, entries, frames in batches.itervalues():
+            for (_, position, alt), frame in zip(entries, frames):
+                self._write_logs(target, frame, position, alt)
+            target.write_log(rows[target.callsign], self.time0)
+        if self.targets.primary in rows:
+            self._estimate_landing(rows[self.targets.primary])
+
+    def _mark_stored(self, read_times):
+        """Record store latency of packets read at read_times, with lock"""
+        self.latency.add('store', time.time() - np.array(read_times))
+        oldest = min(read_times)
+        if self._pending_read is None or oldest < self._pending_read:
+            self._pending_read = oldest
+
+    def _decode_frame(self, frame, packet_time=None):
+        """Filter and decode frame, return target, time, position, altitude
+
+        frame may be a TNC2 frame or an already decoded Position.  Returns
+        None if the frame is not a position of a tracked callsign.  The
+        decoder resolves HHMMSSh stamps against the wall clock, so replayed
+        frames are placed by the packet_time the replay resolved, anchored
+        to the decoded time of the first one.
+        """
+        if isinstance(frame, aprs_parser.Position):
+            position = frame
+        else:
+            # drop other callsigns before parsing
+            if not self.targets.accepts(aprs_parser.source_callsign(frame)):
+                return None
+            position = aprs_parser.decode(frame)
+            if position is None:
+                return None
+        target = self.targets.lookup(position.callsign)
+        if target is None:
+            return None
+        if PARAMETERS['aprs_source'] == FILE and \
+           position.timestamp is not None:
+            if self._file_time0 is None:
+                self._file_time0 = position.timestamp
+                self.time0 = self._file_time0
+                self.targets.time0 = self.time0
+            if packet_time is not None:
+                if self._replay_base is None:
+                    self._replay_base = position.timestamp - packet_time
+                timestamp = self._replay_base + packet_time - self.time0
+            else:
+                timestamp = position.timestamp - self.time0
+        else:
+            timestamp = time.time() - self.time0
+        alt = position.alt
+        if alt is None:
+            alt = np.nan
+        return target, timestamp, position, alt
+
+    def _write_logs(self, target, frame, position, alt):
+        """Queue raw frame and parsed position for target log files"""
+        #
+        # are these always available? what else?
+        # dynamic selection?
+        #
+        #np.append(LIVE_DATA['pressures'],
+        #          packet[0].wx_report.pressure)
+        #np.append(LIVE_DATA['temperatures'],
+        #          packet[0].wx_report.temp)
+        if not isinstance(frame, aprs_parser.Position):
+            target.write_raw(''.join([frame, '\n']))
+        target.write_data(''.join([str(time.time()-self.time0),
+                          ',', str(position.lat),
+                          ',', str(position.lon),
+                          ',', str(alt),
+                          #FIXME extra data
+                          #packet[0].wx_report.pressure,
+                          #',', packet[0].wx_report.temp,
+                          '\n']))
+
+    def _store_positions(self, target, entries):
+        """Append (time, position, altitude) entries, return stored rows"""
+        store = target.store
+        old_size = len(store)
+        rows = {
+            'timestamps': np.array([entry[0] for entry in entries], float),
+            'lats': np.array([entry[1].lat for entry in entries], float),
+            'lons': np.array([entry[1].lon for entry in entries], float),
+            'altitudes': np.array([entry[2] for entry in entries], float),
+        }
+        columns = ['timestamps', 'lats', 'lons', 'altitudes']
+        if old_size > 0:
+            # derive speeds of first new row from last stored one
+            previous = [np.concatenate(([store[key][-1]], rows[key]))
+                        for key in columns]
+            horizontal, vertical = derive_speeds(*previous)
+        else:
+            horizontal, vertical = derive_speeds(*[rows[key]
+                                                   for key in columns])
+            first = [0.0, 0.0]
+            if len(horizontal) > 0:
+                first = [horizontal[0], vertical[0]]
+            horizontal = np.concatenate(([first[0]], horizontal))
+            vertical = np.concatenate(([first[1]], vertical))
+        rows['horizontal_speed'] = horizontal
+        rows['vertical_speed'] = vertical
+        store.extend(rows)
+        if old_size == 1:
+            store.set_value('horizontal_speed', 0, horizontal[0])
+            store.set_value('vertical_speed', 0, vertical[0])
+        target.history.retain(store)
+        self.targets.version += 1
+        return rows
+
+    def _init_descent(self):
+        """Start landing estimate from flight data already stored"""
+        self.descent = DescentPredictor(PARAMETERS['descent_band'],
+                                        BALLOON['alt0'])
+        self.landing = None
+        data = LIVE_DATA.snapshot()
+        self.descent.add(LIVE_HISTORY.query(
+            data['timestamps'][0] if len(data) > 0 else None))
+        self._estimate_landing(data)
+
+    def _estimate_landing(self, rows):
+        """Update analytic landing estimate with new rows of primary target
+
+        Runs with every packet, while the ensemble prediction refreshes
+        in the background.
+        """
+        start = time.time()
+        self.descent.add(rows)
+        if PARAMETERS['descent_predictor']:
+            self.landing = self.descent.predict()
+        else:
+            self.landing = None
+        self.latency.add('landing', time.time() - start)
+
+    def chase_location(self):
+        """Freshest chase vehicle fix, launch site if there is none"""
+        data = CHASE_DATA.snapshot()
+        if len(data) > 0:
+            return data['lats'][-1], data['lons'][-1], data['altitudes'][-1]
+        return self.loc['lat'], self.loc['lon'], self.loc['alt']
 
     def _calculate_trajectories(self):
         """Calculate estimated trajectories using pyBalloon"""
         print "calculate initial trajectories"
-        trajectories = []
-        for data in self.model_data:
-            trajectories.append(pyBalloon.pyb_traj.calc_movements(data,
-                                self.loc0, BALLOON))
-        pyBalloon.pyb_io.save_kml(PARAMETERS['kml_file'], trajectories)
+        self.scheduler.request(self.loc0)
 
-    def _update_trajectories(self):
+    def _update_trajectories(self, loc1):
         """Calculate estimated trajectories using\
            pyBalloon using collected data"""
         print "update trajectories"
-        trajectories = []
-        loc1 = (LIVE_DATA['lats'][-1], LIVE_DATA['lons'][-1], LIVE_DATA['altitudes'][-1])
-        for data in self.model_data:
-            #trajectories.append(pyBalloon.pyb_traj.calc_movements(data,
-            #                    loc1, BALLOON,
-            #                    live_data=LIVE_DATA))
-            trajectories.append(pyBalloon.pyb_traj.calc_movements(data,
-                                loc1, BALLOON))
-        pyBalloon.pyb_io.save_kml(PARAMETERS['kml_file'], trajectories)
+        self.scheduler.request(loc1)
+
+    def _predict(self, loc):
+        """Run ensemble prediction from loc, called by scheduler thread
+
+        Landing statistics are updated and passed to the master as each
+        member finishes.  The trajectories go to the master directly, KML
+        is only written as an optional side output.
+        """
+        predictor = self.predictor
+        if predictor is None:
+            return
+        stats = LandingStatistics(len(self.model_data))
+        def finished(index, trajectory):
+            """Add landing point of finished member to statistics"""
+            stats.add(trajectory)
+            summary = stats.summary()
+            # no summary until a member has a landing point
+            if summary is not None:
+                self.ensemble = summary
+                self.master.update_ensemble(summary)
+        #trajectories = self.predictor.predict(loc, BALLOON,
+        #                                      live_data=LIVE_DATA)
+        trajectories = predictor.predict(loc, BALLOON, finished)
+        if trajectories is None:
+            # executor closed by exit()
+            return
+        self.master.update_prediction(trajectories)
+        if PARAMETERS['kml_export']:
+            write_kml(PARAMETERS['kml_file'], trajectories)
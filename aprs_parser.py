@@ -0,0 +1,255 @@
+#! /usr/bin/python
+"""Native APRS position decoder
+
+Decodes the common uncompressed and compressed position reports in plain
+Python and falls back to libfap for everything else.
+"""
+import sys
+import time
+import calendar
+from collections import namedtuple
+from importtime import lazy_import
+
+# loaded by init_libfap() when the first packet needs it
+libfap = None
+fapLOCATION = None
+_LIBFAP_TRIED = False
+_LIBFAP_INITIALISED = False
+
+Position = namedtuple('Position', ['callsign', 'timestamp', 'lat', 'lon',
+                                   'alt', 'course', 'speed'])
+
+FEET = 0.3048
+KNOT = 1.852 # km/h
+
+def source_callsign(tnc2_frame):
+    """Source callsign of a TNC2 frame without parsing it"""
+    end = tnc2_frame.find('>')
+    if end <= 0:
+        return None
+    return tnc2_frame[:end]
+
+def _timestamp(stamp, now=None):
+    """Convert 7 character APRS timestamp to UNIX time"""
+    if len(stamp) < 7:
+        return None
+    if now is None:
+        now = time.time()
+    kind = stamp[6]
+    try:
+        first, second, third = int(stamp[0:2]), int(stamp[2:4]), \
+                               int(stamp[4:6])
+    except ValueError:
+        return None
+    if kind == 'h':
+        today = time.gmtime(now)
+        value = calendar.timegm((today.tm_year, today.tm_mon, today.tm_mday,
+                                 first, second, third, 0, 0, 0))
+        if value > now + 3600:
+            value -= 86400
+        return value
+    elif kind == 'z' or kind == '/':
+        if kind == 'z':
+            today = time.gmtime(now)
+            convert = calendar.timegm
+        else:
+            today = time.localtime(now)
+            convert = time.mktime
+        year, month = today.tm_year, today.tm_mon
+        if first > today.tm_mday + 1:
+            # stamp from previous month
+            month -= 1
+            if month == 0:
+                year, month = year - 1, 12
+        try:
+            return convert((year, month, first, second, third, 0, 0, 0, -1))
+        except (ValueError, OverflowError):
+            return None
+    return None
+
+def _uncompressed(body):
+    """Decode DDMM.mmN/DDDMM.mmW position, return lat, lon, rest"""
+    if len(body) < 19:
+        return None
+    lat_s = body[0:8].replace(' ', '0')
+    lon_s = body[9:18].replace(' ', '0')
+    try:
+        lat = int(lat_s[0:2]) + float(lat_s[2:7]) / 60.0
+        lon = int(lon_s[0:3]) + float(lon_s[3:8]) / 60.0
+    except ValueError:
+        return None
+    if lat_s[7] == 'S':
+        lat = -lat
+    elif lat_s[7] != 'N':
+        return None
+    if lon_s[8] == 'W':
+        lon = -lon
+    elif lon_s[8] != 'E':
+        return None
+    if lat > 90.0 or lon > 180.0 or lat < -90.0 or lon < -180.0:
+        return None
+    return lat, lon, body[19:]
+
+def _base91(chars):
+    """Decode base-91 number"""
+    value = 0
+    for char in chars:
+        value = value*91 + ord(char) - 33
+    return value
+
+def _compressed(body):
+    """Decode compressed position, return lat, lon, alt, course, speed"""
+    if len(body) < 13:
+        return None
+    for char in body[1:9]:
+        if char < '!' or char > '{':
+            return None
+    lat = 90.0 - _base91(body[1:5]) / 380926.0
+    lon = -180.0 + _base91(body[5:9]) / 190463.0
+    alt = None
+    course = None
+    speed = None
+    c_char, s_char, t_char = body[10], body[11], body[12]
+    if c_char != ' ':
+        if ((ord(t_char) - 33) & 0x18) == 0x10:
+            alt = 1.002**_base91(c_char + s_char) * FEET
+        elif '!' <= c_char <= 'z':
+            course = (ord(c_char) - 33) * 4
+            speed = (1.08**(ord(s_char) - 33) - 1) * KNOT
+    return lat, lon, alt, course, speed, body[13:]
+
+def _comment_altitude(comment):
+    """Altitude in metres from /A=nnnnnn comment field"""
+    index = comment.find('/A=')
+    if index < 0:
+        return None
+    digits = comment[index+3:index+9]
+    try:
+        return int(digits) * FEET
+    except ValueError:
+        return None
+
+def decode_native(tnc2_frame, now=None):
+    """Decode position report in Python, None if format is not supported"""
+    header_end = tnc2_frame.find(':')
+    if header_end < 0 or header_end + 1 >= len(tnc2_frame):
+        return None
+    callsign = source_callsign(tnc2_frame[:header_end])
+    if callsign is None:
+        return None
+    body = tnc2_frame[header_end+1:]
+    kind = body[0]
+    timestamp = None
+    if kind == '!' or kind == '=':
+        body = body[1:]
+    elif kind == '/' or kind == '@':
+        timestamp = _timestamp(body[1:8], now)
+        if timestamp is None:
+            return None
+        body = body[8:]
+    else:
+        return None
+    if body == '':
+        return None
+    if '0' <= body[0] <= '9' or body[0] == ' ':
+        decoded = _uncompressed(body)
+        if decoded is None:
+            return None
+        lat, lon, comment = decoded
+        course = None
+        speed = None
+        if len(comment) >= 7 and comment[3] == '/':
+            try:
+                course = int(comment[0:3]) % 360
+                speed = int(comment[4:7]) * KNOT
+                comment = comment[7:]
+            except ValueError:
+                pass
+        alt = _comment_altitude(comment)
+    else:
+        decoded = _compressed(body)
+        if decoded is None:
+            return None
+        lat, lon, alt, course, speed, comment = decoded
+        if alt is None:
+            alt = _comment_altitude(comment)
+    return Position(callsign, timestamp, lat, lon, alt, course, speed)
+
+def init_libfap():
+    """Import and initialise libfap if needed, False if not available"""
+    global libfap, fapLOCATION, _LIBFAP_TRIED, _LIBFAP_INITIALISED
+    if not _LIBFAP_TRIED:
+        _LIBFAP_TRIED = True
+        try:
+            module = lazy_import('libfap.libfap', 'aprs')
+            libfap = module.libfap
+            fapLOCATION = module.fapLOCATION
+        except (ImportError, OSError):
+            print "libfap not available, decoding natively only"
+    if libfap is not None and not _LIBFAP_INITIALISED:
+        libfap.fap_init()
+        _LIBFAP_INITIALISED = True
+    return libfap is not None
+
+def cleanup_libfap():
+    """Release libfap if it was initialised"""
+    global _LIBFAP_INITIALISED
+    if _LIBFAP_INITIALISED:
+        libfap.fap_cleanup()
+        _LIBFAP_INITIALISED = False
+
+def decode_libfap(tnc2_frame):
+    """Decode position report with libfap, None if it is not a position"""
+    if not init_libfap():
+        return None
+    position = None
+    packet = libfap.fap_parseaprs(tnc2_frame, len(tnc2_frame), 0)
+    if packet[0].type and packet[0].type[0] == fapLOCATION.value:
+        def value(pointer):
+            """Dereference optional field"""
+            if pointer:
+                return pointer[0]
+            return None
+        position = Position(packet[0].src_callsign,
+                            value(packet[0].timestamp),
+                            value(packet[0].latitude),
+                            value(packet[0].longitude),
+                            value(packet[0].altitude),
+                            value(packet[0].course),
+                            value(packet[0].speed))
+    libfap.fap_free(packet)
+    return position
+
+def decode(tnc2_frame):
+    """Decode position report, natively if possible, else with libfap"""
+    position = decode_native(tnc2_frame)
+    if position is None:
+        position = decode_libfap(tnc2_frame)
+    return position
+
+def benchmark(fname, repeat=100):
+    """Compare native and libfap parse throughput on an APRS log file"""
+    filep = open(fname, 'r')
+    frames = [line.strip() for line in filep if '>' in line]
+    filep.close()
+    frames = [frame[6:] if frame.startswith('APRS: ') else frame
+              for frame in frames]
+    results = {}
+    decoders = [('native', decode_native)]
+    if init_libfap():
+        decoders.append(('libfap', decode_libfap))
+    for name, decoder in decoders:
+        start = time.time()
+        for _ in xrange(repeat):
+            for frame in frames:
+                decoder(frame)
+        elapsed = time.time() - start
+        results[name] = len(frames) * repeat / elapsed
+        print "%s: %.0f frames/s" % (name, results[name])
+    if 'libfap' in results:
+        cleanup_libfap()
+        print "speedup: %.1fx" % (results['native'] / results['libfap'])
+    return results
+
+if __name__ == "__main__":
+    benchmark(sys.argv[1] if len(sys.argv) > 1 else 'test_data2.aprs')
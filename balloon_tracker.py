@@ -2,21 +2,32 @@
 """Balloon tracker"""
 import sys
 import os
-from collections import OrderedDict
-import aprs_daemon
+import time
+import json
+from collections import deque
+from importtime import timed, print_report
+with timed('daemon'):
+    import aprs_daemon
+    from session import PARAMETER_SETTINGS, BALLOON_SETTINGS, \
+                        load_session, save_session
 import numpy as np
-
-from PyQt4 import QtGui, QtCore
-from PyQt4 import QtWebKit
-from PyQt4.QtWebKit import QWebPage
-import PyQt4.Qwt5 as Qwt
-
-from matplotlib import rcParams
-from mpl_toolkits.axes_grid1 import host_subplot
-import mpl_toolkits.axisartist as aa
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_qt4agg import FigureCanvasQTAgg\
-                                            as FigureCanvas
+from plot_lod import MinMaxDecimator, expand_limits
+from trajectory_export import to_geojson
+from ensemble_stats import nearest
+
+with timed('qt'):
+    from PyQt4 import QtGui, QtCore
+    from PyQt4 import QtWebKit
+    from PyQt4.QtWebKit import QWebPage
+    import PyQt4.Qwt5 as Qwt
+
+with timed('matplotlib'):
+    from matplotlib import rcParams
+    from mpl_toolkits.axes_grid1 import host_subplot
+    import mpl_toolkits.axisartist as aa
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_qt4agg import FigureCanvasQTAgg\
+                                                as FigureCanvas
 #from matplotlib.backends.backend_qt4agg import NavigationToolbar2QTAgg\
 #                                                as NavigationToolbar
 
@@ -31,63 +42,12 @@ DATA_LABELS = [
     'horizontal_speed', 'Horizontal speed (m/s)',
 ]
 
-# key, title, type, num parameters=0, parameters...
-PARAMETER_SETTINGS = OrderedDict([
-    ('aprs_source',                 ["APRS source",                   "selectint", 3, "SDR", 0, "RS232", 1, "File", 2]),
-    ('aprs_file',                   ["APRS file",                     "string"]),
-    ('update_interval',             ["Update interval (s)",           "int"]),
-    ('callsign',                    ["Callsign",                      "string"]),
-    ('sdr_freq',                    ["SDR frequency (MHz)",           "double"]),
-    ('sdr_rate',                    ["SDR sample rate (Hz)",          "int"]),
-    ('sdr_gain',                    ["SDR gain",                      "int"]),
-    ('sdr_serial_port',             ["SDR Serial port",               "int"]),
-    ('sdr_serial_rate',             ["SDR Serial baudrate",           "int"]),
-    ('sdr_serial_bytesize',         ["SDR Serial bytesize",           "selectint", 4, "5", 5, "6", 6, "7", 7, "8", 8]),
-    ('sdr_serial_parity',           ["SDR Serial parity",             "selectstring", 5, "None", 'N', "Even", 'E', "Odd", 'O',\
-                                                                                     "Mark", 'M', "Space", 'S']),
-    ('sdr_serial_stopbits',         ["SDR Serial stopbits",           "selectint", 3, "1", 1, "1.5", 1.5, "2", 2]),
-    ('sdr_serial_timeout',          ["SDR Serial timeout",            "int"]),
-    ('sdr_serial_xonxoff',          ["SDR Serial XONXOFF",            "bool"]),
-    ('sdr_serial_rtscts',           ["SDR Serial rtscts",             "bool"]),
-    ('sdr_serial_writetimeout',     ["SDR Serial write timeout",      "int"]),
-    ('sdr_serial_dsrdtr',           ["SDR Serial DSRDTS",             "bool"]),
-    ('sdr_serial_interchartimeout', ["SDR Serial inter char timeout", "int"]),
-    ('raw_file',                    ["Raw data file",                 "string"]),
-    ('data_file',                   ["Parsed data file",              "string"]),
-    ('simulate',                    ["Simulate trajectory",           "bool"]),
-    ('gfs_dir',                     ["GFS directory",                 "string"]),
-    ('kml_file',                    ["KML file",                      "string"]),
-    ('gps',                         ["Enable GPS",                    "bool"]),
-    ('gps_serial_port',             ["GPS Serial port",               "int"]),
-    ('gps_serial_rate',             ["GPS Serial baudrate",           "int"]),
-    ('gps_serial_bytesize',         ["GPS Serial bytesize",           "selectint", 4, "5", 5, "6", 6, "7", 7, "8", 8]),
-    ('gps_serial_parity',           ["GPS Serial parity",             "selectstring", 5, "None", 'N', "Even", 'E', "Odd", 'O',\
-                                                                                     "Mark", 'M', "Space", 'S']),
-    ('gps_serial_stopbits',         ["GPS Serial stopbits",           "selectint", 3, "1", 1, "1.5", 1.5, "2", 2]),
-    ('gps_serial_timeout',          ["GPS Serial timeout",            "int"]),
-    ('gps_serial_xonxoff',          ["GPS Serial XONXOFF",            "bool"]),
-    ('gps_serial_rtscts',           ["GPS Serial rtscts",             "bool"]),
-    ('gps_serial_writetimeout',     ["GPS Serial write timeout",      "int"]),
-    ('gps_serial_dsrdtr',           ["GPS Serial DSRDTS",             "bool"]),
-    ('gps_serial_interchartimeout', ["GPS Serial inter char timeout", "int"])
-])
-
-BALLOON_SETTINGS = OrderedDict([
-    ('lat0',                      ["Latitude (deg)",                "double"]),
-    ('lon0',                      ["Longitude (deg)",               "double"]),
-    ('alt0',                      ["Altitude (m)",                  "double"]),
-    ('altitude_step',             ["Altitude step (m)",             "double"]),
-    ('equip_mass',                ["Equipment mass (kg)",           "double"]),
-    ('balloon_mass',              ["Balloon mass (kg)",             "double"]),
-    ('fill_radius',               ["Fill radius (m)",               "double"]),
-    ('radius_empty',              ["Empty radius (m)",              "double"]),
-    ('burst_radius',              ["Burst radius (m)",              "double"]),
-    ('thickness_empty',           ["Empty thickness (mm)",          "double"]),
-    ('Cd_balloon',                ["Cd balloon",                    "double"]),
-    ('Cd_parachute',              ["Cd parachute",                  "double"]),
-    ('parachute_areas',           ["Parachute areas (m^2)",         "doublelist"]),
-    ("parachute_change_altitude", ["Parachute change altitude (m)", "double"])
-])
+LANDING_LABELS = ['Landing latitude', 'Landing longitude',
+                  'Time to landing (s)']
+
+ENSEMBLE_LABELS = ['Ensemble members', 'Ensemble mean latitude',
+                   'Ensemble mean longitude', 'Landing ellipse axes (m)',
+                   'Nearest landing (m)']
 
 class SettingsDialog(QtGui.QDialog):
     """GUI for handling settings"""
@@ -214,9 +174,116 @@ class SettingsDialog(QtGui.QDialog):
         """Dicard all modified settings"""
         self.reject()
 
+class MapBridge(QtCore.QObject):
+    """Batched update channel to the map page
+
+    Map updates are queued and sent as one updateMap() JavaScript call
+    per UI frame instead of one evaluateJavaScript round trip each.
+    """
+    FRAME_MS = 40
+
+    def __init__(self, webview, parent=None):
+        """Initialise bridge"""
+        QtCore.QObject.__init__(self, parent)
+        self.webview = webview
+        self.pending = {}
+        self.track = []
+        # latest updates of layers the map page clears on reset
+        self.prediction = None
+        self.ensemble = None
+        self.scheduled = False
+        self.calls = 0
+
+    def _schedule(self):
+        """Flush queued updates on next UI frame"""
+        if not self.scheduled:
+            self.scheduled = True
+            QtCore.QTimer.singleShot(self.FRAME_MS, self.flush)
+
+    def reset(self, predictions=False):
+        """Clear track and markers, and predictions if predictions is True
+
+        The map page applies the reset before other queued updates and
+        clears every layer, so the latest prediction and ensemble are
+        queued again unless they are cleared as well.
+        """
+        self.pending['reset'] = True
+        self.track = []
+        if predictions:
+            self.prediction = None
+            self.ensemble = None
+        for key in ['prediction', 'ensemble']:
+            latest = getattr(self, key)
+            if latest is None:
+                self.pending.pop(key, None)
+            elif key not in self.pending:
+                self.pending[key] = latest
+        self._schedule()
+
+    def add_track(self, lats, lons):
+        """Queue new track points"""
+        self.track.extend(zip(np.asarray(lats).tolist(),
+                              np.asarray(lons).tolist()))
+        self._schedule()
+
+    def set_balloon(self, lat, lon):
+        """Queue balloon marker position"""
+        self.pending['balloon'] = [float(lat), float(lon)]
+        self._schedule()
+
+    def set_chase(self, lat, lon):
+        """Queue chase vehicle marker position"""
+        self.pending['chase'] = [float(lat), float(lon)]
+        self._schedule()
+
+    def set_center(self, lat, lon):
+        """Queue map center"""
+        self.pending['center'] = [float(lat), float(lon)]
+        self._schedule()
+
+    def set_landing(self, lat, lon):
+        """Queue analytic landing estimate marker position"""
+        self.pending['landing'] = [float(lat), float(lon)]
+        self._schedule()
+
+    def set_ensemble(self, ensemble, point):
+        """Queue ensemble landing mean, ellipse and point nearest chase"""
+        update = {'mean': [float(value) for value in ensemble['mean']],
+                  'nearest': [float(value) for value in point]}
+        if ensemble['ellipse'] is not None:
+            update['ellipse'] = np.round(ensemble['ellipse'], 5).tolist()
+        self.ensemble = update
+        self.pending['ensemble'] = update
+        self._schedule()
+
+    def set_prediction(self, geojson):
+        """Queue predicted trajectories as a GeoJSON FeatureCollection"""
+        self.prediction = geojson
+        self.pending['prediction'] = geojson
+        self._schedule()
+
+    def payload(self):
+        """JavaScript call for queued updates, clears the queue"""
+        update = self.pending
+        if len(self.track) > 0:
+            update['track'] = self.track
+        self.pending = {}
+        self.track = []
+        return "updateMap(%s);" % json.dumps(update)
+
+    def flush(self):
+        """Send queued updates to map"""
+        self.scheduled = False
+        if len(self.pending) == 0 and len(self.track) == 0:
+            return
+        self.webview.page().mainFrame().evaluateJavaScript(self.payload())
+        self.calls += 1
+
 class MainWindow(QtGui.QMainWindow):
     """Balloon tracker main window"""
     updatetrigger = QtCore.pyqtSignal()
+    predictiontrigger = QtCore.pyqtSignal()
+    ensembletrigger = QtCore.pyqtSignal()
     def __init__(self):
         """Initialise main window"""
         super(MainWindow, self).__init__()
@@ -227,6 +294,8 @@ class MainWindow(QtGui.QMainWindow):
         self.resize(800, 600)
         centralwidget = QtGui.QWidget(self)
         self.updatetrigger.connect(self._update_all)
+        self.predictiontrigger.connect(self._update_prediction)
+        self.ensembletrigger.connect(self._update_ensemble)
         sizepol = QtGui.QSizePolicy(QtGui.QSizePolicy.Expanding,
                                     QtGui.QSizePolicy.Expanding)
         sizepol.setHorizontalStretch(0)
@@ -252,9 +321,25 @@ class MainWindow(QtGui.QMainWindow):
         self.canvas = None
         self.plots = []
         self.axes = []
+        self.decimators = []
+        self.plot_width = None
+        self.plotted = 0
+        self.blit = None
+        self.background = None
+        self.limits = []
+        self.xlimits = None
+        self.frame_times = {True: deque(maxlen=100),
+                            False: deque(maxlen=100)}
+        self.rendered = None
         gridlayout.addWidget(self.create_plot(centralwidget), 1, 0, 1, 1)
         #map area
         self.webview = None
+        self.mapbridge = None
+        self.mapped = 0
+        self.trajectories = None
+        self.prediction = None
+        self.ensemble = None
+        self.ensemble_shown = None
         self.create_map(centralwidget)
         gridlayout.addWidget(self.webview, 0, 0, 1, 1)
         mainlayout.addLayout(gridlayout)
@@ -338,6 +423,8 @@ class MainWindow(QtGui.QMainWindow):
         for row in range(len(DATA_LABELS)/2):
             self.items.append(QtGui.QTreeWidgetItem(treewidget,
                               [DATA_LABELS[1+2*row], '']))
+        for label in LANDING_LABELS + ENSEMBLE_LABELS:
+            self.items.append(QtGui.QTreeWidgetItem(treewidget, [label, '']))
         treewidget.resizeColumnToContents(0)
         treewidget.resizeColumnToContents(1)
         treewidget.insertTopLevelItems(0, self.items)
@@ -370,6 +457,8 @@ class MainWindow(QtGui.QMainWindow):
         self.startstop.setObjectName("startstop")
         self.followtoggle = QtGui.QAction("&Follow GPS", self)
         self.followtoggle.setObjectName("followtoggle")
+        dump_latency = QtGui.QAction("Dump &Latency Statistics", self)
+        dump_latency.setObjectName("dump_latency")
         general_settings = QtGui.QAction("&General", self)
         general_settings.setObjectName("general_settings")
         balloon_settings = QtGui.QAction("&Balloon", self)
@@ -386,6 +475,8 @@ class MainWindow(QtGui.QMainWindow):
         menu_file.addAction(exit_program)
         menu_operation.addAction(self.startstop)
         menu_operation.addAction(self.followtoggle)
+        menu_operation.addSeparator()
+        menu_operation.addAction(dump_latency)
         menu_help.addAction(help_window)
         menu_help.addSeparator()
         menu_help.addAction(about)
@@ -411,6 +502,8 @@ class MainWindow(QtGui.QMainWindow):
                 QtCore.SIGNAL("triggered()"), self._startstop)
         QtCore.QObject.connect(self.followtoggle,
                 QtCore.SIGNAL("triggered()"), self._followtoggle)
+        QtCore.QObject.connect(dump_latency,
+                QtCore.SIGNAL("triggered()"), self._dump_latency)
         QtCore.QObject.connect(general_settings,
                 QtCore.SIGNAL("triggered()"), self._general_settings)
         QtCore.QObject.connect(balloon_settings,
@@ -442,14 +535,15 @@ class MainWindow(QtGui.QMainWindow):
         plotlayout.setObjectName("plotlayout")
         fig = plt.figure(dpi=100)#, frameon=False figsize=(20, 4), 
         fig.patch.set_facecolor('white')
+        data = aprs_daemon.LIVE_DATA.snapshot()
         rcParams['axes.color_cycle'] = ['k', 'b', 'g', 'r']
         self.canvas = FigureCanvas(fig)
         self.axes.append(host_subplot(111, axes_class=aa.Axes))
         self.axes[0].set_xlabel("Time")
         self.axes[0].set_ylabel(DATA_LABELS[9])
         self.axes[0].set_aspect('auto', 'datalim') 
-        self.plots.append(self.axes[0].plot(aprs_daemon.LIVE_DATA['timestamps'],
-                           aprs_daemon.LIVE_DATA['altitudes'])[0])
+        self.plots.append(self.axes[0].plot(data['timestamps'],
+                           data['altitudes'])[0])
         fig.add_axes(self.axes[0])
         self.axes[0].axis["left"].label.set_color(self.plots[0].get_color())
         self.axes[0].tick_params(axis='y', color=self.plots[0].get_color())
@@ -469,8 +563,8 @@ class MainWindow(QtGui.QMainWindow):
             self.axes[row-4].axis[side].label.set_visible(True)
             self.axes[row-4].axis[side].major_ticklabels.set_ha(side)
             self.axes[row-4].axis[side].set_label(DATA_LABELS[2*row+1])
-            self.plots.append(self.axes[row-4].plot(aprs_daemon.LIVE_DATA['timestamps'],
-                        aprs_daemon.LIVE_DATA[DATA_LABELS[2*row]])[0])
+            self.plots.append(self.axes[row-4].plot(data['timestamps'],
+                        data[DATA_LABELS[2*row]])[0])
 
             self.axes[row-4].axis[side].label.set_color(self.plots[row-4].get_color())
             self.axes[row-4].set_aspect('auto', 'datalim') 
@@ -480,6 +574,7 @@ class MainWindow(QtGui.QMainWindow):
         fig.tight_layout()
         self.canvas.setParent(plotframe)
         self.canvas.setStyleSheet("background-color: rgb(255, 0, 255);")
+        self.canvas.mpl_connect('draw_event', self._on_plot_draw)
         self.canvas.draw()
         plotlayout.addWidget(self.canvas)
         return plotframe
@@ -498,6 +593,7 @@ class MainWindow(QtGui.QMainWindow):
         self.webview.setObjectName("webview")
         self.webview.load(QtCore.QUrl.fromLocalFile(os.path.dirname(os.path.realpath(__file__)) + "/gmap_openlayers.html"))
         self.webview.show()
+        self.mapbridge = MapBridge(self.webview, self)
 
     def _about(self):
         """Show information about program"""
@@ -522,61 +618,239 @@ class MainWindow(QtGui.QMainWindow):
                                 aprs_daemon.BALLOON, BALLOON_SETTINGS)
         dialog.exec_()
 
-    def _update_current_data(self):
+    def _update_current_data(self, data):
         """Update current data and compass"""
+        if len(data) == 0:
+            return
         for row in range(len(DATA_LABELS)/2):
-            if len(aprs_daemon.LIVE_DATA[DATA_LABELS[2*row]]) > 0:
-                self.items[row].setText(1,
-                    str(round(aprs_daemon.LIVE_DATA[DATA_LABELS[2*row]][-1], 2)))
-        lat0 = self.datahandler.loc['lat']
-        lon0 = self.datahandler.loc['lon']
-        lat1 = aprs_daemon.LIVE_DATA['lats'][-1]
-        lon1 = aprs_daemon.LIVE_DATA['lons'][-1]
-        self.compass.setValue(aprs_daemon.direction(lat0, lon0, lat1, lon1))
+            self.items[row].setText(1,
+                str(round(data[DATA_LABELS[2*row]][-1], 2)))
+        landing = self.datahandler.landing
+        values = ['', '', '']
+        if landing is not None:
+            values = [str(round(landing[0], 4)), str(round(landing[1], 4)),
+                      str(int(landing[2] - data['timestamps'][-1]))]
+        for row, value in enumerate(values):
+            self.items[len(DATA_LABELS)/2 + row].setText(1, value)
+        lat0, lon0, _ = self.datahandler.chase_location()
+        lat1 = data['lats'][-1]
+        lon1 = data['lons'][-1]
+        self._set_compass(aprs_daemon.direction(lat0, lon0, lat1, lon1))
         self.distancelabel.setText(''.join([str(int(aprs_daemon.distance(lat0, lon0, lat1, lon1))), ' m']))
 
-    def _update_dataplot(self):
-        """Update data plot"""
-        for row in range(4, len(DATA_LABELS)/2):
-            self.plots[row-4].set_data(aprs_daemon.LIVE_DATA['timestamps'],
-                    aprs_daemon.LIVE_DATA[DATA_LABELS[2*row]])
-            
-            self.axes[row-4].relim()
-            self.axes[row-4].autoscale_view()
-        self.canvas.draw()
-
-    def _update_map(self):
-        """Update map"""
+    def _set_compass(self, bearing):
+        """Point compass needle to bearing in degrees clockwise from north
+
+        QwtCompass has north at 0 and angles growing clockwise, the same
+        convention as geodesy.initial_bearing, so the bearing is shown as
+        is.  Any change of the compass orientation belongs here.
+        """
+        self.compass.setValue(bearing % 360)
+
+    def _update_dataplot(self, data):
+        """Update data plot
+
+        New rows are fed to per-series MinMaxDecimators keyed to the canvas
+        width, so the plotted point count does not grow with the flight.
+        Rows already rolled out of LIVE_DATA are fed from the minima and
+        maxima of LIVE_HISTORY when the plot is rebuilt.  self.plotted
+        counts rows since the flight start, including rolled out ones.
+        With plot_blit enabled only the lines are redrawn over a cached
+        background, and the whole figure is redrawn only when an axis has
+        to grow.
+        """
+        start = time.time()
+        blit = bool(aprs_daemon.PARAMETERS['plot_blit'])
+        if blit != self.blit:
+            self.blit = blit
+            for plot in self.plots:
+                plot.set_animated(blit)
+            self.limits = [None] * len(self.plots)
+            self.background = None
+        width = self.canvas.width()
+        size = len(data)
+        if width != self.plot_width or data.offset + size < self.plotted or \
+           0 < self.plotted < data.offset:
+            # resolution changed, data cleared or rows not yet plotted
+            # rolled into history, rebuild from scratch
+            self.plot_width = width
+            self.decimators = [MinMaxDecimator(width) for _ in self.plots]
+            self.plotted = 0
+        full_redraw = not self.blit or self.background is None
+        # speeds of the first row are only known once the second arrives
+        if data.offset + size >= 2:
+            if self.plotted < data.offset:
+                history = aprs_daemon.LIVE_HISTORY.query(
+                    data['timestamps'][0] if size > 0 else None)
+                # each bucket as its minimum and maximum at its mean time
+                times = np.repeat(history['timestamps'], 2)
+                for row in range(4, len(DATA_LABELS)/2):
+                    key = DATA_LABELS[2*row]
+                    self.decimators[row-4].add(times, np.column_stack(
+                        (history[key + '_min'],
+                         history[key + '_max'])).ravel())
+            first = max(self.plotted - data.offset, 0)
+            timestamps = data['timestamps'][first:]
+            for row in range(4, len(DATA_LABELS)/2):
+                decimator = self.decimators[row-4]
+                decimator.add(timestamps, data[DATA_LABELS[2*row]][first:])
+                xdata, ydata = decimator.data()
+                self.plots[row-4].set_data(xdata, ydata)
+                if not self.blit:
+                    self.axes[row-4].relim()
+                    self.axes[row-4].autoscale_view()
+                elif len(xdata) > 0:
+                    if row == 4:
+                        limits = expand_limits(self.xlimits, xdata[0],
+                                               xdata[-1])
+                        if limits is not None:
+                            self.xlimits = limits
+                            self.axes[0].set_xlim(limits)
+                            full_redraw = True
+                    limits = expand_limits(self.limits[row-4],
+                                           np.nanmin(ydata),
+                                           np.nanmax(ydata))
+                    if limits is not None:
+                        self.limits[row-4] = limits
+                        self.axes[row-4].set_ylim(limits)
+                        full_redraw = True
+            self.plotted = data.offset + size
+        if full_redraw:
+            self.canvas.draw()
+        else:
+            self.canvas.restore_region(self.background)
+            for plot, axes in zip(self.plots, self.axes):
+                axes.draw_artist(plot)
+            self.canvas.blit(self.canvas.figure.bbox)
+        self.frame_times[full_redraw].append(time.time() - start)
+
+    def _on_plot_draw(self, event):
+        """Cache plot background after full redraw and draw lines on it"""
+        if not self.blit:
+            return
+        self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        for plot, axes in zip(self.plots, self.axes):
+            axes.draw_artist(plot)
+
+    def plot_frame_time(self):
+        """Mean full redraw and blit frame times in seconds"""
+        return [np.mean(times) if len(times) > 0 else np.nan
+                for times in [self.frame_times[True],
+                              self.frame_times[False]]]
+
+    def _update_map(self, data):
+        """Update map
+
+        Rows already rolled out of LIVE_DATA are drawn from the bucket
+        means of LIVE_HISTORY when the track is rebuilt.
+        """
         #FIXME follow current location or balloon?
-        string = ""
-        if self.followtarget == 0:
-          string = "setCenter(%s, %s);" % \
-                   (str(aprs_daemon.LIVE_DATA['lats'][-1]),
-                   str(aprs_daemon.LIVE_DATA['lons'][-1]))
+        size = len(data)
+        if data.offset + size < self.mapped or 0 < self.mapped < data.offset:
+            # data cleared or rows not yet mapped rolled into history
+            self.mapbridge.reset()
+            self.mapped = 0
+        if self.mapped < data.offset:
+            history = aprs_daemon.LIVE_HISTORY.query(
+                data['timestamps'][0] if size > 0 else None)
+            self.mapbridge.add_track(history['lats'], history['lons'])
+            self.mapped = data.offset
+        if data.offset + size > self.mapped:
+            first = self.mapped - data.offset
+            self.mapbridge.add_track(data['lats'][first:],
+                                     data['lons'][first:])
+            self.mapped = data.offset + size
+        if size > 0:
+            self.mapbridge.set_balloon(data['lats'][-1], data['lons'][-1])
+        landing = self.datahandler.landing
+        if landing is not None:
+            self.mapbridge.set_landing(landing[0], landing[1])
+        chase = self.datahandler.chase_location()
+        self.mapbridge.set_chase(chase[0], chase[1])
+        if self.followtarget == 0 and size > 0:
+            self.mapbridge.set_center(data['lats'][-1], data['lons'][-1])
         else:
-          string = "setCenter(%s, %s);" % \
-                   (str(self.datahandler.loc['lat']),
-                   str(self.datahandler.loc['lon']))
-        self.webview.page().mainFrame().evaluateJavaScript(string)
-        string = "addPosition(%s, %s);" % \
-                 (str(self.datahandler.loc['lat']),
-                 str(self.datahandler.loc['lon']))
-        self.webview.page().mainFrame().evaluateJavaScript(string)
-        #update tracks
-        string = "addNode(%s, %s);" % (str(aprs_daemon.LIVE_DATA['lats'][-1]),
-                 str(aprs_daemon.LIVE_DATA['lons'][-1]))
-        self.webview.page().mainFrame().evaluateJavaScript(string)
+            self.mapbridge.set_center(chase[0], chase[1])
 
     def _update_all(self):
-        """Update all data in window"""
-        self._update_current_data()
-        self._update_dataplot()
-        self._update_map()
+        """Update all data in window from one consistent snapshot"""
+        data = aprs_daemon.LIVE_DATA.snapshot()
+        self._update_current_data(data)
+        self._update_dataplot(data)
+        self._update_map(data)
+        self._update_ensemble()
+        chase = aprs_daemon.CHASE_DATA.snapshot()
+        if len(chase) > 0 and time.time() - chase['timestamps'][-1] < 5:
+            self.gpsstatus.setStyleSheet('color: green')
+        else:
+            self.gpsstatus.setStyleSheet('color: gray')
+        latency = self.datahandler.latency
+        read_time = self.datahandler.read_time
+        if read_time is not None and read_time != self.rendered:
+            self.rendered = read_time
+            latency.add('render', time.time() - read_time)
+        full, blit = self.plot_frame_time()
+        self.statusmessage.setText("Plot redraw %.1f ms, blit %.1f ms | %s" %
+                                   (1000*full, 1000*blit,
+                                    latency.status_text()))
+
+    def _dump_latency(self):
+        """Write latency statistics to latency file"""
+        fname = aprs_daemon.PARAMETERS['latency_file']
+        self.datahandler.latency.dump(fname)
+        self.statusbar.showMessage("Latency statistics written to %s" % fname,
+                                   5000)
 
     def update_data(self):
         """Trigger data update"""
         self.updatetrigger.emit()
 
+    def update_prediction(self, trajectories):
+        """Store latest predicted trajectories, called by scheduler thread
+
+        The GeoJSON for the map is built here, off the UI thread.
+        """
+        self.trajectories = trajectories
+        self.prediction = to_geojson(trajectories)
+        self.predictiontrigger.emit()
+
+    def _update_prediction(self):
+        """Send latest prediction to map"""
+        if self.prediction is not None:
+            self.mapbridge.set_prediction(self.prediction)
+
+    def update_ensemble(self, ensemble):
+        """Store ensemble landing statistics, called by scheduler thread"""
+        self.ensemble = ensemble
+        self.ensembletrigger.emit()
+
+    def _update_ensemble(self):
+        """Show ensemble landing statistics on map and in data panel
+
+        The landing point nearest to the chase vehicle is looked up again
+        whenever either the statistics or the chase vehicle change.
+        """
+        ensemble = self.ensemble
+        if ensemble is None:
+            return
+        chase = self.datahandler.chase_location()
+        points, distances = nearest(ensemble['points'], chase[0], chase[1])
+        shown = (id(ensemble), tuple(points[0]))
+        if shown == self.ensemble_shown:
+            return
+        self.ensemble_shown = shown
+        self.mapbridge.set_ensemble(ensemble, points[0])
+        axes = ''
+        if ensemble['axes'] is not None:
+            axes = '%d x %d' % tuple(ensemble['axes'])
+        values = ['%d/%d' % (ensemble['members'], ensemble['total']),
+                  str(round(ensemble['mean'][0], 4)),
+                  str(round(ensemble['mean'][1], 4)),
+                  axes, str(int(distances[0]))]
+        first = len(DATA_LABELS)/2 + len(LANDING_LABELS)
+        for row, value in enumerate(values):
+            self.items[first + row].setText(1, value)
+
     def _startstop(self):
         """Start collecting and processing data"""
         if self.datahandler.is_active():
@@ -587,17 +861,20 @@ class MainWindow(QtGui.QMainWindow):
         else:
             self.startstop.setText("&Stop")
             self.runstatus.setText("Running")
-            string = "cleanUpMarkers(0);\naddKML(\"%s\");\n\
-                     setCenter(%s, %s);\naddPosition(%s, %s);\n\
-                     addPosition(%s, %s);" % \
-                     (aprs_daemon.PARAMETERS['kml_file'],
-                     str(aprs_daemon.BALLOON['lat0']),
+            string = "cleanUpMarkers(0);\n\
+                     setCenter(%s, %s);\naddPosition(%s, %s);" % \
+                     (str(aprs_daemon.BALLOON['lat0']),
                      str(aprs_daemon.BALLOON['lon0']),
                      str(aprs_daemon.BALLOON['lat0']),
-                     str(aprs_daemon.BALLOON['lon0']),
-                     str(self.datahandler.loc['lat']),
-                     str(self.datahandler.loc['lon']))
+                     str(aprs_daemon.BALLOON['lon0']))
             self.webview.page().mainFrame().evaluateJavaScript(string)
+            # predictions of an earlier run do not belong to this one
+            self.mapbridge.reset(True)
+            self.mapped = 0
+            self.ensemble = None
+            self.ensemble_shown = None
+            chase = self.datahandler.chase_location()
+            self.mapbridge.set_chase(chase[0], chase[1])
             if not self.datahandler.is_alive():
                 self.datahandler = aprs_daemon.DataHandlerThread(self)
             self.datahandler.start()
@@ -637,87 +914,14 @@ class MainWindow(QtGui.QMainWindow):
             fname = QtGui.QFileDialog.getOpenFileName(self, 'Open session',
                         '/home', 'Session files (*.ucl)')
         if fname:
-            try:
-                filep = open(fname, 'r')
-                for line in filep:
-                    line = line.strip('\n')
-                    if line == "##GENERAL##":
-                        params = aprs_daemon.PARAMETERS
-                        param_conf = PARAMETER_SETTINGS
-                    elif line == "##BALLOON##":
-                        params = aprs_daemon.BALLOON
-                        param_conf = BALLOON_SETTINGS
-                    elif line != "":
-                        content = line.split('\t')
-                        if param_conf[content[0]][1] == "double":
-                            params[content[0]] =  float(content[1])
-                        elif param_conf[content[0]][1] == "int" or \
-                             param_conf[content[0]][1] == "selectint":
-                            if param_conf[content[0]][1] == "int" and \
-                               content[1] == '-1':
-                                params[content[0]] = None
-                            else:
-                                params[content[0]] = int(content[1])
-                        elif param_conf[content[0]][1] == "bool":
-                            params[content[0]] = bool(int(content[1]))
-                        elif param_conf[content[0]][1] == "doublelist":
-                            values = content[1].split(",")
-                            if content[0] == "parachute_areas":
-                                values = np.pi * np.array([float(values[0]), float(values[1])])**2
-                            params[content[0]] = values
-                        else:
-                            params[content[0]] = str(content[1])
-                filep.close()
-            except IOError:
-                print "IOError"
-            except ValueError:
-                print "ValueError"
-            except TypeError:
-                print "TypeError"
+            load_session(str(fname))
 
     def _save_session(self):
         """Save current session settings"""
         fname = QtGui.QFileDialog.getSaveFileName(self,
                 "Save session", "/home", "Session files (*.ucl)")
         if fname:
-            try:
-                filep = open(fname, 'w')
-                filep.write('##GENERAL##\n')
-                for key in PARAMETER_SETTINGS.keys():
-                    if PARAMETER_SETTINGS[key][1] == "bool":
-                        filep.write(''.join([key, '\t',
-                                str(int(aprs_daemon.PARAMETERS[key])), '\n']))
-                    elif PARAMETER_SETTINGS[key][1] == "int" and \
-                         aprs_daemon.PARAMETERS[key] is None:
-                        filep.write(''.join([key, '\t-1\n']))
-                    else:
-                        filep.write(''.join([key, '\t',
-                                    str(aprs_daemon.PARAMETERS[key]), '\n']))
-                filep.write('##BALLOON##\n')
-                for key in BALLOON_SETTINGS.keys():
-                    if BALLOON_SETTINGS[key][1] == "bool":
-                        filep.write(''.join([key, '\t',
-                                    str(int(aprs_daemon.BALLOON[key])), '\n']))
-                    elif BALLOON_SETTINGS[key][1] == "int" and \
-                         aprs_daemon.BALLOON[key] is None:
-                        filep.write(''.join([key, '\t-1\n']))
-                    elif BALLOON_SETTINGS[key][1] == "doublelist":
-                        values = aprs_daemon.BALLOON[key]
-                        if key == "parachute_areas":
-                            values = [np.sqrt(values[0]/np.pi),
-                                      np.sqrt(values[1]/np.pi)]
-                        itervalues = iter(values)
-                        string = str(next(itervalues))
-                        for value in itervalues:
-                            string += ","+str(value)
-                        filep.write(''.join([key, '\t', string, '\n']))
-                    else:
-                        filep.write(''.join([key, '\t',
-                                    str(aprs_daemon.BALLOON[key]), '\n']))
-                filep.close()
-            except IOError:
-                print "IO error"
-
+            save_session(str(fname))
 
 
 class WebPage(QWebPage):
@@ -735,6 +939,7 @@ def main():
     app = MainWindow()
     app.setStyleSheet("QStatusBar::item { border-width: 1px 1px; border-style: inset; border-color: #cccccc }; ");
     app.show()
+    print_report()
     sys.exit(root.exec_())
 
 if __name__ == "__main__":
@@ -0,0 +1,358 @@
+#! /usr/bin/python
+"""Offline benchmark suite on synthetic flights
+
+Runs without radio, serial ports or network.  Every benchmark reports the
+best time per item over several repeats, so lower is always better, and
+results are written as JSON which can be compared against an earlier run
+to spot regressions.  Benchmarks whose dependencies are missing are
+reported as skipped.
+"""
+import os
+import sys
+import time
+import json
+import shutil
+import platform
+import tempfile
+import subprocess
+import argparse
+from StringIO import StringIO
+from collections import OrderedDict
+import numpy as np
+import synthetic_flight
+import aprs_parser
+from replay import ReplaySource, FAST
+from flight_store import FlightStore
+from geodesy import derive_speeds, flight_speeds
+
+RESULTS_VERSION = 1
+
+def best_time(func, repeat):
+    """Best wall clock time of repeat calls of func"""
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def _result(seconds, count, unit, scale=1e6):
+    """Result entry of seconds spent on count items"""
+    return {'value': scale * seconds / max(count, 1), 'unit': unit,
+            'items': count}
+
+def _replayed(frames):
+    """Frames as read by a replay and their packet times
+
+    The decoder resolves HHMMSSh stamps against the wall clock, so times
+    are taken from the replay to keep results independent of the time of
+    day the benchmark is run.
+    """
+    replay = ReplaySource(StringIO('\n'.join(frames)), FAST,
+                          batch=len(frames))
+    return replay.due_frames()
+
+def _positions(replayed):
+    """Decoded positions of the primary callsign as flight store rows"""
+    frames, stamps = replayed
+    callsign = frames[0].split('>')[0]
+    entries = [(stamp, position) for stamp, position in
+               zip(stamps, [aprs_parser.decode_native(frame)
+                            for frame in frames])
+               if position is not None and position.callsign == callsign]
+    time0 = entries[0][0]
+    rows = {'timestamps': np.array([stamp - time0 for stamp, _ in entries],
+                                   float),
+            'lats': np.array([p.lat for _, p in entries]),
+            'lons': np.array([p.lon for _, p in entries]),
+            'altitudes': np.array([p.alt for _, p in entries], float)}
+    rows['horizontal_speed'], rows['vertical_speed'] = flight_speeds(
+        rows['timestamps'], rows['lats'], rows['lons'], rows['altitudes'])
+    return rows
+
+def bench_parse(frames, options):
+    """Native decoder throughput"""
+    seconds = best_time(lambda: [aprs_parser.decode_native(frame)
+                                 for frame in frames], options.repeat)
+    return _result(seconds, len(frames), 'us/frame')
+
+def bench_parse_libfap(frames, options):
+    """libfap decoder throughput"""
+    if not aprs_parser.init_libfap():
+        return {'skipped': 'libfap not available'}
+    seconds = best_time(lambda: [aprs_parser.decode_libfap(frame)
+                                 for frame in frames], options.repeat)
+    aprs_parser.cleanup_libfap()
+    return _result(seconds, len(frames), 'us/frame')
+
+def bench_store_append(rows, options):
+    """Row by row FlightStore append"""
+    count = len(rows['timestamps'])
+    items = [dict((key, rows[key][i]) for key in rows) for i in range(count)]
+    def append():
+        """Append all rows to new store"""
+        store = FlightStore()
+        for item in items:
+            store.append(item)
+    return _result(best_time(append, options.repeat), count, 'us/row')
+
+def bench_store_extend(rows, options):
+    """FlightStore extend in batches of the replay batch size"""
+    count = len(rows['timestamps'])
+    def extend():
+        """Extend new store in batches"""
+        store = FlightStore()
+        for start in range(0, count, 64):
+            store.extend(dict((key, rows[key][start:start+64])
+                              for key in rows))
+    return _result(best_time(extend, options.repeat), count, 'us/row')
+
+def bench_speeds(rows, options):
+    """Vectorized speed derivation of a whole flight"""
+    args = [rows[key] for key in ['timestamps', 'lats', 'lons', 'altitudes']]
+    seconds = best_time(lambda: flight_speeds(*args), options.repeat)
+    return _result(seconds, len(rows['timestamps']), 'us/row')
+
+def bench_speeds_batched(rows, options):
+    """Speed derivation of 64 row batches as done when packets arrive"""
+    keys = ['timestamps', 'lats', 'lons', 'altitudes']
+    count = len(rows['timestamps'])
+    def derive():
+        """Derive speeds batch by batch"""
+        for start in range(1, count, 64):
+            derive_speeds(*[rows[key][start-1:start+64] for key in keys])
+    return _result(best_time(derive, options.repeat), count, 'us/row')
+
+def bench_ingest(replayed, options):
+    """Filter, decode, store and log frames through DataHandlerThread"""
+    frames, stamps = replayed
+    try:
+        import aprs_daemon
+    except ImportError, error:
+        return {'skipped': str(error)}
+    tmpdir = tempfile.mkdtemp(prefix='benchmark')
+    saved = dict(aprs_daemon.PARAMETERS)
+    aprs_daemon.PARAMETERS.update({
+        'aprs_source': aprs_daemon.FILE,
+        'callsign': frames[0].split('>')[0],
+        'multi_target': False,
+        'flight_log_resume': False,
+        'raw_file': os.path.join(tmpdir, 'raw.dat'),
+        'data_file': os.path.join(tmpdir, 'data.dat'),
+        'flight_log': os.path.join(tmpdir, 'flight.bin'),
+        'latency_file': os.path.join(tmpdir, 'latency.json')})
+    handler = aprs_daemon.DataHandlerThread(None)
+    handler.logwriter.start()
+    def ingest():
+        """Ingest all frames in replay sized batches"""
+        aprs_daemon.LIVE_DATA.clear()
+        aprs_daemon.LIVE_HISTORY.clear()
+        handler.targets.open(handler.logwriter, time.time())
+        for start in range(0, len(frames), 64):
+            handler.handle_aprs_batch(frames[start:start+64], None,
+                                      stamps[start:start+64])
+        handler.targets.close()
+    try:
+        seconds = best_time(ingest, options.repeat)
+    finally:
+        handler.exit()
+        aprs_daemon.PARAMETERS.clear()
+        aprs_daemon.PARAMETERS.update(saved)
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    return _result(seconds, len(frames), 'us/frame')
+
+def _qt_window():
+    """Tracker main window for GUI benchmarks, or reason it is missing"""
+    if not os.environ.get('DISPLAY'):
+        return None, 'no display'
+    try:
+        import balloon_tracker
+        from PyQt4 import QtGui
+    except ImportError, error:
+        return None, str(error)
+    if getattr(_qt_window, 'window', None) is None:
+        _qt_window.app = QtGui.QApplication(sys.argv)
+        _qt_window.window = balloon_tracker.MainWindow()
+    return _qt_window.window, None
+
+def bench_plot(rows, options):
+    """MainWindow._update_dataplot time with data arriving in batches"""
+    window, reason = _qt_window()
+    if window is None:
+        return {'skipped': reason}
+    count = len(rows['timestamps'])
+    def plot():
+        """Plot flight 64 rows at a time"""
+        store = FlightStore()
+        # force decimators to be rebuilt
+        window.plot_width = None
+        for start in range(0, count, 64):
+            store.extend(dict((key, rows[key][start:start+64])
+                              for key in rows))
+            window._update_dataplot(store.snapshot())
+    updates = (count + 63) // 64
+    return _result(best_time(plot, options.repeat), updates, 'ms/update',
+                   1e3)
+
+def bench_mapbridge(rows, options):
+    """MapBridge track queueing and updateMap() payload encoding"""
+    window, reason = _qt_window()
+    if window is None:
+        return {'skipped': reason}
+    bridge = window.mapbridge
+    count = len(rows['timestamps'])
+    def send():
+        """Queue flight 64 points at a time and encode each update"""
+        for start in range(0, count, 64):
+            bridge.add_track(rows['lats'][start:start+64],
+                             rows['lons'][start:start+64])
+            bridge.set_balloon(rows['lats'][start], rows['lons'][start])
+            bridge.payload()
+            bridge.track = []
+            bridge.pending = {}
+    return _result(best_time(send, options.repeat), count, 'us/point')
+
+def bench_calc_movements(rows, options):
+    """pyBalloon trajectory calculation per ensemble member"""
+    try:
+        import pyBalloon.pyb_io
+        import pyBalloon.pyb_traj
+        import aprs_daemon
+    except ImportError, error:
+        return {'skipped': str(error)}
+    balloon = aprs_daemon.BALLOON
+    bbox = (balloon['lat0']+1.5, balloon['lon0']-1.5,
+            balloon['lat0']-1.5, balloon['lon0']+1.5)
+    try:
+        model_data = pyBalloon.pyb_io.read_gfs_set(options.gfs_dir, bbox)
+    except (IOError, OSError, IndexError, ValueError), error:
+        return {'skipped': 'no GFS data: %s' % error}
+    members = model_data[:options.members]
+    loc = (balloon['lat0'], balloon['lon0'], balloon['alt0'])
+    seconds = best_time(lambda: [pyBalloon.pyb_traj.calc_movements(
+                                     data, loc, balloon)
+                                 for data in members], options.repeat)
+    return _result(seconds, len(members), 'ms/member', 1e3)
+
+# name: (function, input)
+BENCHMARKS = OrderedDict([
+    ('parse_native',     (bench_parse,           'frames')),
+    ('parse_libfap',     (bench_parse_libfap,    'frames')),
+    ('store_append',     (bench_store_append,    'rows')),
+    ('store_extend',     (bench_store_extend,    'rows')),
+    ('speeds_flight',    (bench_speeds,          'rows')),
+    ('speeds_batched',   (bench_speeds_batched,  'rows')),
+    ('ingest',           (bench_ingest,          'replay')),
+    ('plot_update',      (bench_plot,            'rows')),
+    ('mapbridge',        (bench_mapbridge,       'rows')),
+    ('calc_movements',   (bench_calc_movements,  'rows')),
+])
+
+def _commit():
+    """Current git commit, None outside a repository"""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(options):
+    """Run selected benchmarks, return results"""
+    frames = synthetic_flight.generate(
+        interval=options.interval, seed=options.seed,
+        others=['OTHER%d' % i for i in range(options.stations)],
+        other_fraction=options.other_fraction,
+        duplicate_fraction=options.duplicates,
+        malformed_fraction=options.malformed)
+    replayed = _replayed(frames)
+    inputs = {'frames': frames, 'replay': replayed,
+              'rows': _positions(replayed)}
+    results = OrderedDict()
+    for name, (func, data) in BENCHMARKS.iteritems():
+        if options.only and name not in options.only:
+            continue
+        results[name] = func(inputs[data], options)
+        print format_result(name, results[name])
+    parameters = dict((key, value) for key, value in vars(options).items()
+                      if key not in ('output', 'compare', 'only', 'tolerance'))
+    return {'version': RESULTS_VERSION,
+            'time': time.time(),
+            'environment': {'python': platform.python_version(),
+                            'numpy': np.__version__,
+                            'platform': platform.platform(),
+                            'commit': _commit()},
+            'parameters': parameters,
+            'frames': len(frames),
+            'results': results}
+
+def format_result(name, result):
+    """One line description of a result"""
+    if 'skipped' in result:
+        return "%-16s skipped (%s)" % (name, result['skipped'])
+    return "%-16s %10.3f %s" % (name, result['value'], result['unit'])
+
+def compare(results, baseline, tolerance):
+    """Print changes against baseline results, return regressed names"""
+    regressions = []
+    if baseline.get('parameters') != results['parameters']:
+        print "Warning: benchmark parameters differ from baseline"
+    for name, result in results['results'].iteritems():
+        old = baseline['results'].get(name, {})
+        if 'value' not in result or 'value' not in old or \
+           old.get('unit') != result['unit']:
+            continue
+        ratio = result['value'] / old['value'] if old['value'] > 0 else 1.0
+        flag = ''
+        if ratio > 1 + tolerance:
+            flag = 'REGRESSION'
+            regressions.append(name)
+        elif ratio < 1 - tolerance:
+            flag = 'improved'
+        print "%-16s %10.3f -> %10.3f %-10s %6.2fx %s" % (
+            name, old['value'], result['value'], result['unit'], ratio, flag)
+    return regressions
+
+def main():
+    """Run benchmarks from command line"""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--interval', type=float, default=1.0,
+                        help="seconds between packets of the flight")
+    parser.add_argument('--stations', type=int, default=3,
+                        help="number of other callsigns")
+    parser.add_argument('--other-fraction', type=float, default=0.2,
+                        help="rate of other station packets per packet")
+    parser.add_argument('--duplicates', type=float, default=0.05,
+                        help="fraction of duplicated frames")
+    parser.add_argument('--malformed', type=float, default=0.01,
+                        help="fraction of malformed frames")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5,
+                        help="repeats per benchmark, best is reported")
+    parser.add_argument('--members', type=int, default=4,
+                        help="ensemble members for calc_movements")
+    parser.add_argument('--gfs-dir', default='/tmp/gfs')
+    parser.add_argument('--only', nargs='*', choices=BENCHMARKS.keys(),
+                        help="benchmarks to run")
+    parser.add_argument('--output', help="write results JSON to file")
+    parser.add_argument('--compare', help="baseline results JSON")
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help="relative slowdown reported as regression")
+    options = parser.parse_args()
+    results = run(options)
+    if options.output:
+        filep = open(options.output, 'w')
+        json.dump(results, filep, indent=1)
+        filep.close()
+    if options.compare:
+        filep = open(options.compare, 'r')
+        baseline = json.load(filep)
+        filep.close()
+        if compare(results, baseline, options.tolerance):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Analytic landing estimate from the observed flight
+
+After burst the payload falls at its terminal velocity, which grows as
+1/sqrt(density) with altitude.  In an exponential atmosphere the time to
+fall between two altitudes has a closed form, so the landing point and
+time follow from a sea level descent rate fitted to the observed
+vertical speeds and the wind of each altitude band, measured from the
+drift of the balloon during ascent.
+"""
+import math
+from collections import deque
+import numpy as np
+from geodesy import EARTH_RADIUS
+
+# density scale height (m) of the exponential atmosphere
+SCALE_HEIGHT = 7000.0
+
+class DescentPredictor(object):
+    """Incremental landing estimator of one flight
+
+    add() takes rows as they are stored.  Until the altitude has dropped
+    burst_drop metres below its maximum, the horizontal drift between
+    consecutive rows is summed per altitude band of band metres.  After
+    that the vertical speeds of the latest fit row pairs are kept for the
+    descent rate fit.  predict() only works on these sums, so it takes
+    the same time however long the flight is.
+    """
+    def __init__(self, band=500.0, ground=0.0, max_altitude=50000.0,
+                 burst_drop=300.0, fit=30):
+        """Initialise estimator, ground is the landing altitude (m)"""
+        self.band = float(band)
+        self.ground = float(ground)
+        self.bands = int(math.ceil(max_altitude / self.band))
+        self.burst_drop = burst_drop
+        self.east = np.zeros(self.bands)
+        self.north = np.zeros(self.bands)
+        self.duration = np.zeros(self.bands)
+        # altitude and vertical speed of latest descent row pairs
+        self.samples = deque(maxlen=fit)
+        self.last = None
+        self.max_altitude = -np.inf
+        self.burst = False
+
+    def add(self, rows):
+        """Add time sorted rows given as dict of columns"""
+        rows = [np.atleast_1d(np.asarray(rows[key], float))
+                for key in ['timestamps', 'lats', 'lons', 'altitudes']]
+        valid = np.all([np.isfinite(column) for column in rows], axis=0)
+        times, lats, lons, alts = [column[valid] for column in rows]
+        if len(times) == 0:
+            return
+        if self.last is not None:
+            times, lats, lons, alts = [np.r_[previous, column]
+                                       for previous, column in
+                                       zip(self.last, (times, lats, lons,
+                                                       alts))]
+        self.last = (times[-1], lats[-1], lons[-1], alts[-1])
+        peaks = np.maximum.accumulate(np.r_[self.max_altitude, alts])[1:]
+        self.max_altitude = peaks[-1]
+        descending = alts[1:] < peaks[1:] - self.burst_drop
+        if self.burst:
+            descending[:] = True
+        else:
+            # burst is final, later rises are noise
+            descending = np.maximum.accumulate(descending)
+            self.burst = bool(len(descending) > 0 and descending[-1])
+        delta = np.diff(times)
+        step = delta > 0
+        ascent = step & ~descending
+        if np.any(ascent):
+            mid_alt = (alts[1:] + alts[:-1])[ascent] / 2
+            mid_lat = np.radians(lats[1:] + lats[:-1])[ascent] / 2
+            index = np.clip(np.floor(mid_alt / self.band).astype(int),
+                            0, self.bands - 1)
+            east = np.radians(np.diff(lons)[ascent]) * EARTH_RADIUS * \
+                   np.cos(mid_lat)
+            north = np.radians(np.diff(lats)[ascent]) * EARTH_RADIUS
+            self.east += np.bincount(index, east, self.bands)
+            self.north += np.bincount(index, north, self.bands)
+            self.duration += np.bincount(index, delta[ascent], self.bands)
+        descent = step & descending
+        if np.any(descent):
+            self.samples.extend(zip(((alts[1:] + alts[:-1]) / 2)[descent],
+                                    (np.diff(alts) / np.where(step, delta,
+                                                              1.0))[descent]))
+
+    def descent_rate(self):
+        """Fitted sea level descent rate (m/s), None without samples
+
+        Least squares fit of v = rate * exp(z/(2*SCALE_HEIGHT)) to the
+        observed vertical speeds v at altitudes z.
+        """
+        if len(self.samples) == 0:
+            return None
+        samples = np.array(self.samples)
+        scale = np.exp(samples[:, 0] / (2 * SCALE_HEIGHT))
+        rate = -np.dot(samples[:, 1], scale) / np.dot(scale, scale)
+        if not rate > 0:
+            return None
+        return rate
+
+    def winds(self):
+        """East and north wind (m/s) of every band
+
+        Bands the balloon did not drift through get the wind of the
+        nearest measured ones, calm if there are none.
+        """
+        known = self.duration > 0
+        if not np.any(known):
+            return np.zeros(self.bands), np.zeros(self.bands)
+        centers = (np.arange(self.bands) + 0.5) * self.band
+        return [np.interp(centers, centers[known],
+                          values[known] / self.duration[known])
+                for values in (self.east, self.north)]
+
+    def predict(self):
+        """Landing lat, lon and time, None before burst"""
+        if not self.burst or self.last is None:
+            return None
+        rate = self.descent_rate()
+        if rate is None:
+            return None
+        time, lat, lon, alt = self.last
+        if alt <= self.ground:
+            return lat, lon, time
+        first = int(np.clip(math.floor(self.ground / self.band),
+                            0, self.bands - 1))
+        last = int(np.clip(math.floor(alt / self.band), first, self.bands - 1))
+        edges = np.r_[self.ground,
+                      np.arange(first + 1, last + 1) * self.band, alt]
+        # closed form fall time through each band
+        scale = 2 * SCALE_HEIGHT
+        fall = scale / rate * (np.exp(-edges[:-1] / scale) -
+                               np.exp(-edges[1:] / scale))
+        east, north = self.winds()
+        east = np.dot(east[first:last + 1], fall)
+        north = np.dot(north[first:last + 1], fall)
+        lat1 = lat + math.degrees(north / EARTH_RADIUS)
+        lon1 = lon + math.degrees(east / EARTH_RADIUS /
+                                  math.cos(math.radians(lat)))
+        return lat1, lon1, time + fall.sum()
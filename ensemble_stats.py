@@ -0,0 +1,113 @@
+"""Landing dispersion statistics of prediction ensembles"""
+import math
+import numpy as np
+from geodesy import EARTH_RADIUS, haversine
+
+def landing_point(trajectory):
+    """Last finite lat, lon of a trajectory, None if there is none"""
+    lats = np.asarray(trajectory['lats'], float)
+    lons = np.asarray(trajectory['lons'], float)
+    valid = np.flatnonzero(np.isfinite(lats) & np.isfinite(lons))
+    if len(valid) == 0:
+        return None
+    return lats[valid[-1]], lons[valid[-1]]
+
+def nearest(points, lats, lons):
+    """Landing points nearest to each of the given positions
+
+    points is an (n, 2) array of lat, lon.  Returns the nearest point of
+    every position as an (m, 2) array and the distances in metres.
+    """
+    lats = np.atleast_1d(np.asarray(lats, float))
+    lons = np.atleast_1d(np.asarray(lons, float))
+    distances = haversine(points[:, 0][np.newaxis, :],
+                          points[:, 1][np.newaxis, :],
+                          lats[:, np.newaxis], lons[:, np.newaxis])
+    index = np.argmin(distances, axis=1)
+    return points[index], distances[np.arange(len(lats)), index]
+
+class LandingStatistics(object):
+    """Running statistics of the landing points of ensemble members
+
+    add() is called as members finish and only updates running sums, so
+    summary() is available after every member.  The covariance is taken
+    in metres east and north of the mean, and the confidence ellipse
+    holds the given fraction of a bivariate normal distribution.
+    """
+    def __init__(self, members, confidence=0.95, vertices=36):
+        """Initialise statistics of an ensemble of members trajectories"""
+        self.members = members
+        self.confidence = confidence
+        self.vertices = vertices
+        self.points = np.zeros((members, 2))
+        self.count = 0
+        # sums of lat, lon, lat^2, lat*lon and lon^2
+        self.sums = np.zeros(5)
+
+    def add(self, trajectory):
+        """Add landing point of a finished member"""
+        point = landing_point(trajectory)
+        if point is None or self.count == len(self.points):
+            return
+        lat, lon = point
+        self.points[self.count] = point
+        self.count += 1
+        self.sums += [lat, lon, lat*lat, lat*lon, lon*lon]
+
+    def covariance(self):
+        """Mean lat, lon and covariance (m^2) of east and north offsets"""
+        count = self.count
+        lat, lon = self.sums[:2] / count
+        cov_lat = self.sums[2] / count - lat*lat
+        cov_latlon = self.sums[3] / count - lat*lon
+        cov_lon = self.sums[4] / count - lon*lon
+        north = math.radians(1.0) * EARTH_RADIUS
+        east = north * math.cos(math.radians(lat))
+        # sample covariance from population moments
+        unbias = count / (count - 1.0) if count > 1 else 0.0
+        covariance = unbias * np.array(
+            [[east*east*cov_lon, east*north*cov_latlon],
+             [east*north*cov_latlon, north*north*cov_lat]])
+        return lat, lon, covariance
+
+    def ellipse(self, lat, lon, covariance):
+        """Semi axes (m), orientation (deg from north) and outline"""
+        values, vectors = np.linalg.eigh(covariance)
+        values = np.maximum(values, 0.0)
+        # chi-square quantile of two degrees of freedom
+        scale = math.sqrt(-2 * math.log(1 - self.confidence))
+        axes = scale * np.sqrt(values)
+        angles = np.linspace(0, 2*np.pi, self.vertices + 1)
+        offsets = np.dot(vectors, axes[:, np.newaxis] *
+                         np.array([np.cos(angles), np.sin(angles)]))
+        north = math.radians(1.0) * EARTH_RADIUS
+        east = north * math.cos(math.radians(lat))
+        outline = np.column_stack((lat + offsets[1] / north,
+                                   lon + offsets[0] / east))
+        major = vectors[:, 1]
+        orientation = math.degrees(math.atan2(major[0], major[1])) % 180
+        return axes[::-1], orientation, outline
+
+    def summary(self):
+        """Immutable summary of members finished so far, None if none
+
+        Holds member counts, mean, landing points and, from two members
+        on, the confidence ellipse.
+        """
+        if self.count == 0:
+            return None
+        lat, lon, covariance = self.covariance()
+        result = {'members': self.count,
+                  'total': self.members,
+                  'mean': (lat, lon),
+                  'points': self.points[:self.count].copy(),
+                  'axes': None,
+                  'orientation': None,
+                  'confidence': self.confidence,
+                  'ellipse': None}
+        if self.count > 1:
+            axes, orientation, outline = self.ellipse(lat, lon, covariance)
+            result.update({'axes': tuple(axes),
+                           'orientation': orientation,
+                           'ellipse': outline})
+        return result
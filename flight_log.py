@@ -0,0 +1,114 @@
+"""Append-only binary flight log"""
+import os
+import struct
+import numpy as np
+from flight_store import FLIGHT_COLUMNS
+
+MAGIC = 'BTFLIGHT'
+VERSION = 1
+NAME_SIZE = 32
+# magic, version, number of columns
+_PREFIX = struct.Struct('<8sII')
+
+class FlightLog(object):
+    """Log of fixed size records, one little-endian float64 per column
+
+    The header holds a magic string, format version, column count and the
+    NUL padded column names.  Row i starts at header_size() + i *
+    record_size, so the file is its own index and can be memory-mapped as
+    a record array.  Timestamps are stored as epoch seconds, so a reloaded
+    flight keeps its time axis.  A partially written last record is
+    ignored, and cut off before the log is appended to again.
+    """
+    def __init__(self, fname, columns=None):
+        """Initialise log"""
+        if columns is None:
+            columns = FLIGHT_COLUMNS
+        self.fname = fname
+        self.columns = list(columns)
+        self.dtype = np.dtype([(key, '<f8') for key in self.columns])
+
+    def header_size(self):
+        """Size of header in bytes"""
+        return _PREFIX.size + NAME_SIZE * len(self.columns)
+
+    def header(self):
+        """Header of a new log"""
+        return ''.join([_PREFIX.pack(MAGIC, VERSION, len(self.columns))] +
+                       [key.ljust(NAME_SIZE, '\0') for key in self.columns])
+
+    def encode(self, rows, time0):
+        """Records of rows given as dict of columns with times since time0"""
+        records = np.zeros(np.size(rows['timestamps']), self.dtype)
+        for key in self.columns:
+            if key in rows:
+                records[key] = rows[key]
+        records['timestamps'] += time0
+        return records.tostring()
+
+    def _read_columns(self):
+        """Column names in header of existing log, None if not a log"""
+        try:
+            filep = open(self.fname, 'rb')
+            try:
+                prefix = filep.read(_PREFIX.size)
+                if len(prefix) < _PREFIX.size:
+                    return None
+                magic, version, count = _PREFIX.unpack(prefix)
+                if magic != MAGIC or version != VERSION:
+                    return None
+                names = filep.read(NAME_SIZE * count)
+            finally:
+                filep.close()
+        except IOError:
+            return None
+        if len(names) < NAME_SIZE * count:
+            return None
+        return [names[i:i+NAME_SIZE].rstrip('\0')
+                for i in range(0, len(names), NAME_SIZE)]
+
+    def records(self):
+        """Number of complete records in log"""
+        return max(os.path.getsize(self.fname) - self.header_size(), 0) // \
+               self.dtype.itemsize
+
+    def repair(self):
+        """Check that log exists with our columns and drop partial records
+
+        Returns False if the file is missing or not a compatible log.
+        """
+        if self._read_columns() != self.columns:
+            return False
+        size = self.header_size() + self.records() * self.dtype.itemsize
+        if os.path.getsize(self.fname) != size:
+            print "Dropping partial record of flight log", self.fname
+            filep = open(self.fname, 'r+b')
+            filep.truncate(size)
+            filep.close()
+        return True
+
+    def open(self):
+        """Memory-mapped record array of log, None if not a valid log"""
+        if self._read_columns() != self.columns:
+            return None
+        count = self.records()
+        if count == 0:
+            return np.zeros(0, self.dtype)
+        return np.memmap(self.fname, self.dtype, 'r',
+                         offset=self.header_size(), shape=(count,))
+
+    def load(self, time0=None):
+        """Logged flight as dict of columns with times since time0
+
+        time0 defaults to the time of the first record.  Returns time0
+        and the columns, or None and None if there is no valid log.
+        """
+        records = self.open()
+        if records is None:
+            return None, None
+        if time0 is None and len(records) > 0:
+            time0 = records['timestamps'][0]
+        rows = dict((key, records[key]) for key in self.columns)
+        if time0 is not None:
+            rows['timestamps'] = rows['timestamps'] - time0
+        return time0, rows
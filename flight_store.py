@@ -0,0 +1,209 @@
+"""Columnar storage for live flight data"""
+import numpy as np
+
+FLIGHT_COLUMNS = [
+    'timestamps',
+    'lats',
+    'lons',
+    'pressures',
+    'altitudes',
+    'temperatures',
+    'horizontal_speed',
+    'vertical_speed',
+]
+
+class FlightSnapshot(object):
+    """Immutable view of a FlightStore at one version
+
+    All columns have the same length, however the store is modified after
+    the snapshot was taken.  offset is the number of rows discarded from
+    the front of the store before the first row of the snapshot.
+    """
+    def __init__(self, version, size, data, offset=0):
+        """Initialise snapshot"""
+        self.version = version
+        self.offset = offset
+        self._size = size
+        self._data = data
+
+    def __len__(self):
+        """Number of rows in snapshot"""
+        return self._size
+
+    def __contains__(self, key):
+        """Check if snapshot has given column"""
+        return key in self._data
+
+    def __getitem__(self, key):
+        """Read-only view of a column"""
+        view = self._data[key][:self._size]
+        view.flags.writeable = False
+        return view
+
+    def keys(self):
+        """Column names"""
+        return self._data.keys()
+
+class FlightStore(object):
+    """Growable column store backed by NumPy arrays
+
+    Each column is a preallocated float64 array which doubles its capacity
+    when full, so appending is amortised O(1).  Indexing the store with a
+    column name returns a read-only view of the filled part of the column
+    without copying.
+
+    The store has a single writer.  After each modification it publishes
+    the row count and column arrays as one tuple, which readers in other
+    threads pick up with snapshot() without locking.  Published rows are
+    never written in place again: growing, overwriting and clearing
+    replace the affected arrays instead.  discard() drops the oldest rows
+    and counts them in offset, so readers can keep absolute row indexes.
+    """
+    def __init__(self, columns=None, capacity=1024):
+        """Initialise empty store"""
+        if columns is None:
+            columns = FLIGHT_COLUMNS
+        self.columns = list(columns)
+        self._capacity = max(int(capacity), 1)
+        self._size = 0
+        self._data = dict((key, np.zeros(self._capacity))
+                          for key in self.columns)
+        self.version = 0
+        self.offset = 0
+        self._published = (0, 0, dict(self._data), 0)
+
+    def __len__(self):
+        """Number of stored rows"""
+        return self._size
+
+    def __contains__(self, key):
+        """Check if store has given column"""
+        return key in self._data
+
+    def __getitem__(self, key):
+        """Read-only view of the filled part of a column"""
+        view = self._data[key][:self._size]
+        view.flags.writeable = False
+        return view
+
+    def keys(self):
+        """Column names"""
+        return list(self.columns)
+
+    def snapshot(self):
+        """Consistent immutable view of the latest published rows"""
+        version, size, data, offset = self._published
+        return FlightSnapshot(version, size, data, offset)
+
+    def _publish(self):
+        """Make current rows visible to snapshot()"""
+        self.version += 1
+        # a single reference assignment is atomic for readers
+        self._published = (self.version, self._size, dict(self._data),
+                           self.offset)
+
+    def capacity(self):
+        """Number of rows that fit without reallocation"""
+        return self._capacity
+
+    def _reserve(self, size):
+        """Grow all columns geometrically to hold at least size rows"""
+        if size <= self._capacity:
+            return
+        capacity = self._capacity
+        while capacity < size:
+            capacity *= 2
+        for key in self.columns:
+            data = np.zeros(capacity)
+            data[:self._size] = self._data[key][:self._size]
+            self._data[key] = data
+        self._capacity = capacity
+
+    def append(self, row):
+        """Append one row given as dict, missing columns are stored as 0"""
+        self._reserve(self._size + 1)
+        for key in self.columns:
+            self._data[key][self._size] = row.get(key, 0.0)
+        self._size += 1
+        self._publish()
+
+    def extend(self, rows):
+        """Append several rows given as dict of equal length sequences"""
+        count = 0
+        for key in rows:
+            count = len(rows[key])
+            break
+        if count == 0:
+            return
+        self._reserve(self._size + count)
+        for key in self.columns:
+            if key in rows:
+                self._data[key][self._size:self._size+count] = rows[key]
+            else:
+                self._data[key][self._size:self._size+count] = 0.0
+        self._size += count
+        self._publish()
+
+    def set_value(self, key, index, value):
+        """Overwrite a single stored value"""
+        if index < 0:
+            index += self._size
+        if index < 0 or index >= self._size:
+            raise IndexError("FlightStore index out of range")
+        data = self._data[key].copy()
+        data[index] = value
+        self._data[key] = data
+        self._publish()
+
+    def set_column(self, key, values):
+        """Overwrite all stored values of a column"""
+        data = np.zeros(self._capacity)
+        data[:self._size] = values
+        self._data[key] = data
+        self._publish()
+
+    def replace(self, rows):
+        """Replace all rows with rows given as dict of equal length sequences
+
+        Readers see either the old or the new rows, never an empty store.
+        """
+        count = 0
+        for key in rows:
+            count = len(rows[key])
+            break
+        capacity = self._capacity
+        while capacity < count:
+            capacity *= 2
+        data = {}
+        for key in self.columns:
+            data[key] = np.zeros(capacity)
+            if key in rows:
+                data[key][:count] = rows[key]
+        self._data = data
+        self._capacity = capacity
+        self._size = count
+        self._publish()
+
+    def discard(self, count):
+        """Remove the count oldest rows, shrinking a mostly empty store"""
+        count = min(int(count), self._size)
+        if count <= 0:
+            return
+        size = self._size - count
+        while self._capacity > 1 and 4 * size <= self._capacity:
+            self._capacity //= 2
+        for key in self.columns:
+            data = np.zeros(self._capacity)
+            data[:size] = self._data[key][count:self._size]
+            self._data[key] = data
+        self._size = size
+        self.offset += count
+        self._publish()
+
+    def clear(self):
+        """Remove all rows, capacity is kept"""
+        self._size = 0
+        self.offset = 0
+        self._data = dict((key, np.zeros(self._capacity))
+                          for key in self.columns)
+        self._publish()
@@ -0,0 +1,59 @@
+"""Vectorized geodesic helpers
+
+All functions take latitudes and longitudes in degrees as scalars or
+NumPy arrays and broadcast like NumPy ufuncs.  Distances are in metres.
+"""
+import numpy as np
+
+EARTH_RADIUS = 6371000.0
+
+def haversine(lat0, lon0, lat1, lon1):
+    """Great circle distance on a spherical Earth
+
+    The haversine form stays accurate for the few metre spacing between
+    consecutive fixes, unlike the spherical law of cosines.
+    """
+    lat0, lon0, lat1, lon1 = [np.radians(value)
+                              for value in (lat0, lon0, lat1, lon1)]
+    hav = np.sin((lat1 - lat0) / 2)**2 + \
+          np.cos(lat0) * np.cos(lat1) * np.sin((lon1 - lon0) / 2)**2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(hav, 0.0, 1.0)))
+
+def initial_bearing(lat0, lon0, lat1, lon1):
+    """Initial great circle bearing from first to second location
+
+    Returned in degrees clockwise from north in range [0, 360).
+    """
+    lat0, lon0, lat1, lon1 = [np.radians(value)
+                              for value in (lat0, lon0, lat1, lon1)]
+    ydir = np.sin(lon1 - lon0) * np.cos(lat1)
+    xdir = np.cos(lat0) * np.sin(lat1) - \
+           np.sin(lat0) * np.cos(lat1) * np.cos(lon1 - lon0)
+    return np.degrees(np.arctan2(ydir, xdir)) % 360
+
+def derive_speeds(timestamps, lats, lons, altitudes):
+    """Horizontal and vertical speeds between consecutive locations
+
+    Returns arrays one shorter than the input.  Speeds over zero or
+    negative time steps are NaN.
+    """
+    timestamps = np.asarray(timestamps, float)
+    delta = np.diff(timestamps)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        horizontal = haversine(lats[:-1], lons[:-1], lats[1:], lons[1:]) / \
+                     delta
+        vertical = np.diff(altitudes) / delta
+    horizontal[delta <= 0] = np.nan
+    vertical[delta <= 0] = np.nan
+    return horizontal, vertical
+
+def flight_speeds(timestamps, lats, lons, altitudes):
+    """Speeds of a whole flight, one value per location
+
+    Each location gets the speed from the previous one, and the first
+    location the speed to the second, as in the per-packet derivation.
+    """
+    if len(timestamps) < 2:
+        return np.zeros(len(timestamps)), np.zeros(len(timestamps))
+    horizontal, vertical = derive_speeds(timestamps, lats, lons, altitudes)
+    return np.r_[horizontal[:1], horizontal], np.r_[vertical[:1], vertical]
@@ -0,0 +1,134 @@
+"""On-disk cache of cropped GFS model sets"""
+import os
+import shutil
+import hashlib
+import cPickle as pickle
+import numpy as np
+
+class _CachedArray(object):
+    """Placeholder for an array stored in its own .npy file"""
+    def __init__(self, fname):
+        """Initialise placeholder"""
+        self.fname = fname
+
+def _store(value, path, arrays):
+    """Save arrays of nested model data, return picklable structure"""
+    if isinstance(value, np.ndarray) and value.dtype != object:
+        fname = 'array_%d.npy' % len(arrays)
+        np.save(os.path.join(path, fname), value)
+        arrays.append(fname)
+        return _CachedArray(fname)
+    elif isinstance(value, dict):
+        return dict((key, _store(item, path, arrays))
+                    for key, item in value.iteritems())
+    elif isinstance(value, (list, tuple)):
+        return type(value)(_store(item, path, arrays) for item in value)
+    return value
+
+def _load(value, path):
+    """Replace placeholders with memory-mapped arrays"""
+    if isinstance(value, _CachedArray):
+        # copy-on-write, so the cache stays intact if arrays are modified
+        return np.load(os.path.join(path, value.fname), mmap_mode='c')
+    elif isinstance(value, dict):
+        return dict((key, _load(item, path))
+                    for key, item in value.iteritems())
+    elif isinstance(value, (list, tuple)):
+        return type(value)(_load(item, path) for item in value)
+    return value
+
+def _dir_size(path):
+    """Total size of files in directory"""
+    size = 0
+    for fname in os.listdir(path):
+        size += os.path.getsize(os.path.join(path, fname))
+    return size
+
+class GfsCache(object):
+    """Cache of decoded, cropped GFS model sets as .npy files
+
+    Entries are keyed by the names, sizes and modification times of the
+    files in the GFS directory (which identify the model run) and by the
+    bounding box.  Arrays are loaded memory-mapped, and the least recently
+    used entries are removed when the cache grows over max_bytes.
+    """
+    META = 'meta.pkl'
+
+    def __init__(self, cache_dir, max_bytes):
+        """Initialise cache"""
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def key(self, gfs_dir, bbox):
+        """Cache key of GFS directory contents and bounding box"""
+        digest = hashlib.sha1()
+        for fname in sorted(os.listdir(gfs_dir)):
+            stat = os.stat(os.path.join(gfs_dir, fname))
+            digest.update('%s:%d:%d;' % (fname, stat.st_size,
+                                         int(stat.st_mtime)))
+        digest.update(','.join(['%.4f' % value for value in bbox]))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Load cached model set, None if not cached"""
+        path = os.path.join(self.cache_dir, key)
+        try:
+            filep = open(os.path.join(path, self.META), 'rb')
+            structure = pickle.load(filep)
+            filep.close()
+            data = _load(structure, path)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+        # mark as recently used
+        os.utime(path, None)
+        return data
+
+    def put(self, key, model_data):
+        """Store model set and evict old entries"""
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        path = os.path.join(self.cache_dir, key)
+        tmp_path = path + '.tmp'
+        if os.path.isdir(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+        structure = _store(model_data, tmp_path, [])
+        filep = open(os.path.join(tmp_path, self.META), 'wb')
+        pickle.dump(structure, filep, pickle.HIGHEST_PROTOCOL)
+        filep.close()
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.rename(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries over the size limit"""
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if not os.path.isdir(path) or name.endswith('.tmp'):
+                continue
+            size = _dir_size(path)
+            entries.append((os.path.getmtime(path), size, path))
+            total += size
+        entries.sort()
+        while total > self.max_bytes and len(entries) > 1:
+            _, size, path = entries.pop(0)
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def load(self, gfs_dir, bbox, reader):
+        """Cached reader(gfs_dir, bbox)"""
+        try:
+            key = self.key(gfs_dir, bbox)
+        except OSError:
+            return reader(gfs_dir, bbox)
+        data = self.get(key)
+        if data is None:
+            data = reader(gfs_dir, bbox)
+            try:
+                self.put(key, data)
+            except (IOError, OSError):
+                print "Unable to store GFS data to cache"
+        return data
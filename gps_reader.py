@@ -0,0 +1,188 @@
+"""Chase vehicle GPS receiver reader"""
+import os
+import select
+import threading
+import time
+from importtime import lazy_import
+
+CHASE_COLUMNS = [
+    'timestamps',
+    'lats',
+    'lons',
+    'altitudes',
+    'speeds',
+    'courses',
+]
+KNOT = 1852.0 / 3600 # m/s
+SENTENCES = ('GGA', 'RMC')
+
+def checksum_ok(sentence):
+    """Check NMEA checksum, sentences without one are rejected"""
+    star = sentence.rfind('*')
+    if star < 0 or len(sentence) < star + 3:
+        return False
+    try:
+        expected = int(sentence[star+1:star+3], 16)
+    except ValueError:
+        return False
+    value = 0
+    for char in sentence[1:star]:
+        value ^= ord(char)
+    return value == expected
+
+def prefilter(sentence):
+    """Cheap check for a GGA or RMC sentence with a valid checksum"""
+    return len(sentence) > 7 and sentence[0] == '$' and \
+           sentence[3:6] in SENTENCES and checksum_ok(sentence)
+
+def _coordinate(value, hemisphere, width):
+    """Convert NMEA (d)ddmm.mmmm to degrees, None if empty"""
+    if value == '':
+        return None
+    degrees = int(value[:width]) + float(value[width:]) / 60.0
+    if hemisphere == 'S' or hemisphere == 'W':
+        degrees = -degrees
+    return degrees
+
+def parse(sentence):
+    """Parse prefiltered GGA or RMC sentence, None if it has no fix
+
+    Returns sentence type, lat, lon, altitude (m, GGA), speed (m/s, RMC)
+    and course (deg, RMC) with unknown values as NaN.
+    """
+    fields = sentence[:sentence.rfind('*')].split(',')
+    kind = fields[0][3:6]
+    nan = float('nan')
+    try:
+        if kind == 'GGA':
+            if len(fields) < 10 or fields[6] in ('', '0'):
+                return None
+            lat = _coordinate(fields[2], fields[3], 2)
+            lon = _coordinate(fields[4], fields[5], 3)
+            alt = float(fields[9]) if fields[9] else nan
+            speed, course = nan, nan
+        else:
+            if len(fields) < 9 or fields[2] != 'A':
+                return None
+            lat = _coordinate(fields[3], fields[4], 2)
+            lon = _coordinate(fields[5], fields[6], 3)
+            alt = nan
+            speed = float(fields[7]) * KNOT if fields[7] else nan
+            course = float(fields[8]) if fields[8] else nan
+    except ValueError:
+        return None
+    if lat is None or lon is None:
+        return None
+    return kind, lat, lon, alt, speed, course
+
+class GpsReaderThread(threading.Thread):
+    """Thread reading the chase vehicle GPS receiver into a store
+
+    The serial port is drained in bulk whenever it is readable, and only
+    GGA and RMC sentences with valid checksums are parsed.  Every GGA fix
+    is appended with the speed and course of the latest RMC; receivers
+    sending only RMC get a row per RMC.  Rows are stamped with the time
+    they were read, in seconds since the epoch.
+    """
+    def __init__(self, store, serial_settings):
+        """Initialise reader, serial_settings are serial.Serial arguments"""
+        threading.Thread.__init__(self, name='GpsReaderThread')
+        self.daemon = True
+        self.store = store
+        self.serial_settings = serial_settings
+        self.port = None
+        self.sentences = 0
+        self.dropped = 0
+        self._speed = float('nan')
+        self._course = float('nan')
+        self._gga_seen = False
+        # cleared by exit(), which may come before run()
+        self._running = True
+        self._wake_r, self._wake_w = os.pipe()
+
+    def is_active(self):
+        """Check if thread is active"""
+        return self._running
+
+    def exit(self):
+        """Dispose thread"""
+        self._running = False
+        try:
+            os.write(self._wake_w, 'x')
+        except (OSError, TypeError):
+            pass
+
+    def handle_sentence(self, sentence, read_time=None):
+        """Filter, parse and store one NMEA sentence"""
+        self.sentences += 1
+        if not prefilter(sentence):
+            self.dropped += 1
+            return
+        fix = parse(sentence)
+        if fix is None:
+            return
+        kind, lat, lon, alt, speed, course = fix
+        if kind == 'RMC':
+            self._speed, self._course = speed, course
+            if self._gga_seen:
+                return
+        else:
+            self._gga_seen = True
+        if read_time is None:
+            read_time = time.time()
+        self.store.append({'timestamps': read_time,
+                           'lats': lat,
+                           'lons': lon,
+                           'altitudes': alt,
+                           'speeds': self._speed,
+                           'courses': self._course})
+
+    def run(self):
+        """Run thread"""
+        print '', self.name, 'started.'
+        serial = lazy_import('serial', 'serial')
+        try:
+            self.port = serial.Serial(*self.serial_settings)
+        except serial.SerialException:
+            print "GPS: SerialException"
+            print "Opening GPS failed, disabling"
+            self.port = None
+        if self.port is None:
+            self._running = False
+        buf = ''
+        while self._running:
+            try:
+                readable = select.select([self.port.fileno(), self._wake_r],
+                                         [], [])[0]
+            except (select.error, ValueError):
+                print "GPS: Select error"
+                break
+            if self._wake_r in readable:
+                os.read(self._wake_r, 512)
+            if self.port.fileno() not in readable:
+                continue
+            try:
+                data = os.read(self.port.fileno(), 4096)
+            except OSError:
+                print "GPS: OSError"
+                break
+            if data == '':
+                break
+            read_time = time.time()
+            lines = (buf + data).split('\n')
+            buf = lines.pop()
+            for line in lines:
+                self.handle_sentence(line.strip(), read_time)
+        self._running = False
+        if self.port is not None:
+            try:
+                self.port.close()
+            except serial.SerialException:
+                print "GPS: SerialException"
+        for fd in [self._wake_r, self._wake_w]:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self._wake_r = self._wake_w = None
+        print '', self.name, 'ended.'
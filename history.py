@@ -0,0 +1,162 @@
+"""Multi-resolution history of long flights
+
+Rows older than a window are rolled out of a live FlightStore into tiers
+of fixed width time buckets, each holding the row count and the mean,
+minimum and maximum of every column.  The binary flight log keeps every
+row, the tiers only bound what is kept in memory.
+"""
+import numpy as np
+from flight_store import FlightStore, FLIGHT_COLUMNS
+
+# bucket width (s) and row limit of each tier, finest first
+TIERS = [(60.0, 2880), (600.0, 4320)]
+
+def tier_columns(keys):
+    """Columns of a tier aggregating keys"""
+    columns = ['timestamps', 'counts']
+    for key in keys:
+        columns.extend([key, key + '_min', key + '_max'])
+    return columns
+
+def aggregate(rows, bucket, keys):
+    """Merge time sorted rows into buckets of bucket seconds
+
+    rows is a dict of tier columns, rows without counts are raw rows.
+    Means are weighted by count and skip NaN values.  Timestamps are mean
+    times, so they stay within their bucket.
+    """
+    times = np.asarray(rows['timestamps'], float)
+    if len(times) == 0:
+        return dict((column, np.zeros(0)) for column in tier_columns(keys))
+    counts = np.asarray(rows.get('counts', np.ones(len(times))), float)
+    index = np.floor(times / bucket)
+    starts = np.flatnonzero(np.r_[True, index[1:] != index[:-1]])
+    total = np.add.reduceat(counts, starts)
+    result = {'timestamps': np.add.reduceat(times * counts, starts) / total,
+              'counts': total}
+    for key in keys:
+        values = np.asarray(rows[key], float)
+        finite = np.isfinite(values)
+        weight = np.add.reduceat(np.where(finite, counts, 0.0), starts)
+        sums = np.add.reduceat(np.where(finite, values * counts, 0.0), starts)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result[key] = sums / weight
+        result[key + '_min'] = np.fmin.reduceat(rows.get(key + '_min',
+                                                         values), starts)
+        result[key + '_max'] = np.fmax.reduceat(rows.get(key + '_max',
+                                                         values), starts)
+    return result
+
+class HistoryTiers(object):
+    """Bounded aggregated history of rows rolled out of a live store
+
+    retain() moves whole buckets older than window seconds from the live
+    store to the first tier.  A tier over its row limit moves its oldest
+    whole buckets on to the next tier, and the last tier doubles its
+    bucket width instead, so memory stays bounded however long the flight
+    runs.  Like FlightStore the tiers have a single writer, and query()
+    reads them from snapshots without locking.
+    """
+    def __init__(self, keys=None, window=7200.0, tiers=None, chunk=256):
+        """Initialise empty history, window 0 keeps all rows live"""
+        if keys is None:
+            keys = FLIGHT_COLUMNS[1:]
+        if tiers is None:
+            tiers = TIERS
+        self.keys = list(keys)
+        self.window = window
+        self.chunk = chunk
+        self.initial_buckets = [float(bucket) for bucket, _ in tiers]
+        self.buckets = list(self.initial_buckets)
+        self.limits = [int(limit) for _, limit in tiers]
+        self.tiers = [FlightStore(tier_columns(self.keys)) for _ in tiers]
+        self.version = 0
+
+    def __len__(self):
+        """Number of aggregated rows in all tiers"""
+        return sum(len(tier) for tier in self.tiers)
+
+    def clear(self):
+        """Remove all history"""
+        for tier in self.tiers:
+            tier.clear()
+        self.buckets = list(self.initial_buckets)
+        self.version += 1
+
+    def retain(self, store):
+        """Roll rows older than window out of store, True if any were
+
+        Rows are only moved in chunks of at least chunk rows, which keeps
+        the cost of discarding them from the store amortised.
+        """
+        if not self.window or len(store) < self.chunk:
+            return False
+        times = store['timestamps']
+        bucket = self.buckets[0]
+        cut = np.floor((times[-1] - self.window) / bucket) * bucket
+        count = int(np.searchsorted(times, cut))
+        if count < self.chunk:
+            return False
+        self.absorb(dict((key, store[key][:count])
+                         for key in ['timestamps'] + self.keys))
+        store.discard(count)
+        return True
+
+    def absorb(self, rows):
+        """Add raw rows older than any rows still live"""
+        self.tiers[0].extend(aggregate(rows, self.buckets[0], self.keys))
+        self._cascade()
+        self.version += 1
+
+    def _cascade(self):
+        """Move buckets of tiers over their limit on to coarser ones"""
+        for level, tier in enumerate(self.tiers):
+            limit = self.limits[level]
+            while len(tier) > limit:
+                columns = tier.keys()
+                if level + 1 == len(self.tiers):
+                    self.buckets[level] *= 2
+                    rows = aggregate(dict((key, tier[key])
+                                          for key in columns),
+                                     self.buckets[level], self.keys)
+                    # publish merged rows in one step, so readers never
+                    # see an empty tier
+                    tier.replace(rows)
+                    continue
+                # move a quarter of the limit at a time, in whole buckets
+                bucket = self.buckets[level + 1]
+                times = tier['timestamps']
+                last = times[min(len(tier) - limit + limit // 4,
+                                 len(tier)) - 1]
+                count = int(np.searchsorted(
+                    times, (np.floor(last / bucket) + 1) * bucket))
+                rows = aggregate(dict((key, tier[key][:count])
+                                      for key in columns),
+                                 bucket, self.keys)
+                # extend before discarding, so readers never see a gap
+                self.tiers[level + 1].extend(rows)
+                tier.discard(count)
+
+    def query(self, before=None):
+        """Aggregated rows of all tiers as columns, oldest first
+
+        Rows at or after time before, normally the first row of a live
+        store snapshot taken earlier, are left out, as are rows of coarser
+        tiers overlapping finer ones while buckets are being moved.
+        """
+        # finest first, the order in which rows move through the tiers
+        parts = []
+        for tier in self.tiers:
+            data = tier.snapshot()
+            times = data['timestamps']
+            count = len(data)
+            if before is not None:
+                count = int(np.searchsorted(times, before))
+            if count > 0:
+                parts.append(dict((key, data[key][:count])
+                                  for key in data.keys()))
+                before = times[0]
+        parts.reverse()
+        return dict((column, np.concatenate([np.zeros(0)] +
+                                            [part[column] for part in parts]))
+                    for column in tier_columns(self.keys))
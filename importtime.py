@@ -0,0 +1,60 @@
+"""Lazy imports with import time accounting per subsystem
+
+Setting the environment variable TRACKER_IMPORTTIME prints a report of
+the time spent importing each subsystem at startup, like python -X
+importtime but grouped by feature.
+"""
+import os
+import sys
+import time
+import importlib
+from collections import OrderedDict
+
+START = time.time()
+# subsystem: [seconds, modules loaded]
+IMPORT_TIMES = OrderedDict()
+
+class timed(object):
+    """Context manager adding time of imports in it to a subsystem"""
+    def __init__(self, subsystem):
+        """Initialise timer"""
+        self.subsystem = subsystem
+        self.start = None
+        self.modules = 0
+
+    def __enter__(self):
+        """Start timing"""
+        self.modules = len(sys.modules)
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Stop timing and record"""
+        entry = IMPORT_TIMES.setdefault(self.subsystem, [0.0, 0])
+        entry[0] += time.time() - self.start
+        entry[1] += len(sys.modules) - self.modules
+        return False
+
+def lazy_import(name, subsystem):
+    """Import module on first use, timed as part of subsystem"""
+    module = sys.modules.get(name)
+    if module is None:
+        with timed(subsystem):
+            module = importlib.import_module(name)
+    return module
+
+def report():
+    """Import time report, slowest subsystem first"""
+    lines = ["Import times:"]
+    for subsystem, (seconds, modules) in sorted(IMPORT_TIMES.iteritems(),
+                                                key=lambda item: -item[1][0]):
+        lines.append("  %-12s %8.1f ms %5d modules" %
+                     (subsystem, 1000*seconds, modules))
+    lines.append("  %-12s %8.1f ms since start" %
+                 ('total', 1000*(time.time() - START)))
+    return '\n'.join(lines)
+
+def print_report():
+    """Print import time report if TRACKER_IMPORTTIME is set"""
+    if os.environ.get('TRACKER_IMPORTTIME'):
+        print report()
@@ -0,0 +1,116 @@
+"""Latency histograms and throughput counters of the packet pipeline
+
+Stages, all but decode and lock measured from the time a packet was read
+from its source:
+  collect  read until handed to the data handler
+  decode   time spent decoding the frame
+  lock     wait for the data handler lock
+  store    read until stored in the flight store
+  handle   read until noticed by the data handler loop
+  render   read until drawn by the GUI
+  landing  time spent on the analytic landing estimate
+"""
+import json
+import threading
+import time
+from collections import deque, OrderedDict
+import numpy as np
+
+STAGES = ['collect', 'decode', 'lock', 'store', 'handle', 'render',
+          'landing']
+# log spaced histogram bins from 10 us to 100 s
+BIN_EDGES = np.logspace(-5, 2, 36)
+
+class StageStats(object):
+    """Rolling latencies and event counts of one stage"""
+    def __init__(self, window):
+        """Initialise stage"""
+        self.latencies = deque(maxlen=window)
+        self.events = deque(maxlen=window)
+        self.total = 0
+
+    def add(self, latencies, now):
+        """Add latencies of events at time now"""
+        self.latencies.extend(latencies)
+        self.events.append((now, len(latencies)))
+        self.total += len(latencies)
+
+    def rate(self, now, period):
+        """Events per second during last period seconds"""
+        count = sum(number for stamp, number in self.events
+                    if now - stamp <= period)
+        return count / period
+
+    def histogram(self):
+        """Counts of recent latencies in BIN_EDGES bins"""
+        values = np.clip(self.latencies, BIN_EDGES[0], BIN_EDGES[-1])
+        return np.histogram(values, BIN_EDGES)[0]
+
+    def summary(self, now, period):
+        """Count, rate and latency percentiles in seconds"""
+        result = {'count': self.total, 'rate': self.rate(now, period)}
+        if len(self.latencies) > 0:
+            values = np.array(self.latencies)
+            result.update({'mean': values.mean(),
+                           'p50': np.percentile(values, 50),
+                           'p95': np.percentile(values, 95),
+                           'max': values.max()})
+        return result
+
+class LatencyMonitor(object):
+    """Thread-safe rolling statistics of all pipeline stages
+
+    Each stage keeps its window latest latencies; rates are counted over
+    the last period seconds.
+    """
+    def __init__(self, window=1000, period=10.0):
+        """Initialise monitor"""
+        self.window = window
+        self.period = period
+        self.lock = threading.Lock()
+        self.stages = OrderedDict((stage, StageStats(window))
+                                  for stage in STAGES)
+
+    def add(self, stage, latencies):
+        """Add a latency or a sequence of latencies in seconds to stage"""
+        latencies = np.atleast_1d(latencies).tolist()
+        if len(latencies) == 0:
+            return
+        self.lock.acquire()
+        if stage not in self.stages:
+            self.stages[stage] = StageStats(self.window)
+        self.stages[stage].add(latencies, time.time())
+        self.lock.release()
+
+    def summary(self):
+        """Summary of every stage"""
+        now = time.time()
+        self.lock.acquire()
+        result = OrderedDict((stage, stats.summary(now, self.period))
+                             for stage, stats in self.stages.iteritems())
+        self.lock.release()
+        return result
+
+    def status_text(self, stages=('decode', 'store', 'handle', 'render')):
+        """Short summary of 95th percentile latencies and packet rate"""
+        summary = self.summary()
+        parts = ["%s %.1f ms" % (stage, 1000*summary[stage]['p95'])
+                 for stage in stages if 'p95' in summary[stage]]
+        parts.append("%.1f pkt/s" % summary['store']['rate'])
+        return "p95 " + ", ".join(parts)
+
+    def dump(self, fname):
+        """Write summaries and histograms as JSON"""
+        summary = self.summary()
+        self.lock.acquire()
+        for stage, stats in self.stages.iteritems():
+            summary[stage]['histogram'] = stats.histogram().tolist()
+        self.lock.release()
+        try:
+            filep = open(fname, 'w')
+            json.dump({'time': time.time(),
+                       'bin_edges': BIN_EDGES.tolist(),
+                       'stages': summary}, filep, indent=1)
+            filep.close()
+        except IOError:
+            print "Unable to write latency file", fname
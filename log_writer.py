@@ -0,0 +1,146 @@
+"""Background writer for log files"""
+import os
+import threading
+import time
+import Queue
+from collections import deque
+
+_OPEN, _WRITE, _CLOSE, _EXIT = range(4)
+
+class LogWriterThread(threading.Thread):
+    """Thread writing log records fed through a bounded queue
+
+    Records are written in batches and files are flushed when
+    flush_records records have been written or flush_interval seconds have
+    passed since the last flush, optionally followed by fsync.  Producers
+    block if the queue is full.
+    """
+    def __init__(self, maxsize=10000, flush_interval=1.0, flush_records=100,
+                 fsync=False):
+        """Initialise writer thread"""
+        threading.Thread.__init__(self, name='LogWriterThread')
+        self.daemon = True
+        self.queue = Queue.Queue(maxsize)
+        self.flush_interval = flush_interval
+        self.flush_records = flush_records
+        self.fsync = fsync
+        self.files = {}
+        self.records = 0
+        self.latencies = deque(maxlen=1000)
+        self._unflushed = 0
+        self._last_flush = time.time()
+        self._running = True
+
+    def is_active(self):
+        """Check if thread is active"""
+        return self._running
+
+    def open_file(self, name, fname, mode='w'):
+        """Open file fname as log name"""
+        self.queue.put((_OPEN, name, (fname, mode), time.time()))
+
+    def write(self, name, data):
+        """Queue data for log name"""
+        self.queue.put((_WRITE, name, data, time.time()))
+
+    def close_file(self, name):
+        """Flush and close log name"""
+        self.queue.put((_CLOSE, name, None, time.time()))
+
+    def exit(self):
+        """Write queued records, close files and end thread"""
+        self.queue.put((_EXIT, None, None, time.time()))
+
+    def stats(self):
+        """Queue depth, records written and write latencies in seconds"""
+        latencies = list(self.latencies)
+        mean = sum(latencies) / len(latencies) if latencies else 0.0
+        return {'queue_depth': self.queue.qsize(),
+                'records': self.records,
+                'latency_mean': mean,
+                'latency_max': max(latencies) if latencies else 0.0}
+
+    def _flush(self):
+        """Flush all open files"""
+        for filep in self.files.itervalues():
+            try:
+                filep.flush()
+                if self.fsync:
+                    os.fsync(filep.fileno())
+            except (IOError, OSError):
+                print "Unable to flush log file"
+        self._unflushed = 0
+        self._last_flush = time.time()
+
+    def _handle(self, batch):
+        """Handle a batch of queued commands, return False on exit"""
+        chunks = {}
+        order = []
+        stamps = []
+        running = True
+
+        def write_chunks():
+            """Write collected data, one write call per file"""
+            for name in order:
+                try:
+                    self.files[name].write(''.join(chunks[name]))
+                except (IOError, KeyError):
+                    print "IO error"
+            now = time.time()
+            self.latencies.extend(now - stamp for stamp in stamps)
+            self.records += len(stamps)
+            self._unflushed += len(stamps)
+            chunks.clear()
+            del order[:]
+            del stamps[:]
+
+        for command, name, data, stamp in batch:
+            if command == _WRITE:
+                if name not in chunks:
+                    chunks[name] = []
+                    order.append(name)
+                chunks[name].append(data)
+                stamps.append(stamp)
+                continue
+            write_chunks()
+            if command == _OPEN:
+                try:
+                    self.files[name] = open(data[0], data[1])
+                except IOError:
+                    print "Unable to open log file", data[0]
+            elif command == _CLOSE:
+                filep = self.files.pop(name, None)
+                if filep is not None:
+                    try:
+                        filep.close()
+                    except IOError:
+                        print "Unable to close log file"
+            elif command == _EXIT:
+                running = False
+        write_chunks()
+        return running
+
+    def run(self):
+        """Run thread"""
+        print '', self.name, 'started.'
+        while self._running:
+            batch = []
+            try:
+                batch.append(self.queue.get(True, self.flush_interval))
+                while len(batch) < self.flush_records:
+                    batch.append(self.queue.get_nowait())
+            except Queue.Empty:
+                pass
+            self._running = self._handle(batch)
+            if (self._unflushed > 0 and \
+                (self._unflushed >= self.flush_records or \
+                 time.time() - self._last_flush >= self.flush_interval)) or \
+               not self._running:
+                self._flush()
+        for filep in self.files.itervalues():
+            try:
+                filep.close()
+            except IOError:
+                pass
+        self.files.clear()
+        print '', self.name, 'ended.'
@@ -0,0 +1,146 @@
+"""Level-of-detail downsampling for time series plots"""
+import numpy as np
+
+class MinMaxDecimator(object):
+    """Incremental first/min/max/last downsampling of one series
+
+    The x range is split into at most width equally wide buckets, one per
+    pixel column.  Each bucket keeps its first, minimum, maximum and last
+    point, which draws the same line as the full data at that resolution.
+    When a point falls past the last bucket, neighbouring buckets are
+    merged pairwise and the bucket width doubles, so the output size stays
+    bounded by 4*width however long the series grows.
+    """
+    def __init__(self, width=800, bucket=1.0):
+        """Initialise empty decimator"""
+        self.width = max(int(width), 2)
+        self.initial_bucket = float(bucket)
+        self.clear()
+
+    def clear(self):
+        """Remove all points"""
+        self.bucket = self.initial_bucket
+        self.x0 = None
+        self.used = 0
+        self.count = np.zeros(self.width, int)
+        # first, min, max, last points of each bucket
+        self.xs = np.zeros((4, self.width))
+        self.ys = np.zeros((4, self.width))
+
+    def __len__(self):
+        """Number of output points"""
+        return 4 * int(np.count_nonzero(self.count[:self.used]))
+
+    def _coarsen(self):
+        """Merge buckets pairwise and double bucket width"""
+        half = (self.used + 1) // 2
+        count = np.zeros(self.width, int)
+        xs = np.zeros((4, self.width))
+        ys = np.zeros((4, self.width))
+        left = np.arange(0, 2*half, 2)
+        right = left + 1
+        right_count = np.zeros(half, int)
+        valid = right < self.used
+        right_count[valid] = self.count[right[valid]]
+        right = np.minimum(right, self.width - 1)
+        left_count = self.count[left]
+        count[:half] = left_count + right_count
+        has_left = left_count > 0
+        has_right = right_count > 0
+        # first point from left bucket if it has any
+        first = np.where(has_left, left, right)
+        xs[0, :half] = self.xs[0, first]
+        ys[0, :half] = self.ys[0, first]
+        # last point from right bucket if it has any
+        last = np.where(has_right, right, left)
+        xs[3, :half] = self.xs[3, last]
+        ys[3, :half] = self.ys[3, last]
+        # extremes
+        use_right = has_right & (~has_left | \
+                                 (self.ys[1, right] < self.ys[1, left]))
+        pick = np.where(use_right, right, left)
+        xs[1, :half] = self.xs[1, pick]
+        ys[1, :half] = self.ys[1, pick]
+        use_right = has_right & (~has_left | \
+                                 (self.ys[2, right] > self.ys[2, left]))
+        pick = np.where(use_right, right, left)
+        xs[2, :half] = self.xs[2, pick]
+        ys[2, :half] = self.ys[2, pick]
+        self.count, self.xs, self.ys = count, xs, ys
+        self.used = half
+        self.bucket *= 2
+
+    def add(self, xdata, ydata):
+        """Add points sorted by x, NaN values are skipped"""
+        xdata = np.asarray(xdata, float)
+        ydata = np.asarray(ydata, float)
+        valid = np.isfinite(xdata) & np.isfinite(ydata)
+        xdata = xdata[valid]
+        ydata = ydata[valid]
+        if len(xdata) == 0:
+            return
+        if self.x0 is None:
+            self.x0 = xdata[0]
+        while (xdata[-1] - self.x0) / self.bucket >= self.width:
+            self._coarsen()
+        index = ((xdata - self.x0) / self.bucket).astype(int)
+        index = np.clip(index, 0, self.width - 1)
+        # points are sorted, so each bucket is a contiguous group
+        starts = np.flatnonzero(np.r_[True, index[1:] != index[:-1]])
+        ends = np.r_[starts[1:], len(index)] - 1
+        buckets = index[starts]
+        order = np.lexsort((ydata, index))
+        mins = order[starts]
+        order = np.lexsort((-ydata, index))
+        maxs = order[starts]
+        empty = self.count[buckets] == 0
+        # first point only for previously empty buckets
+        self.xs[0, buckets[empty]] = xdata[starts[empty]]
+        self.ys[0, buckets[empty]] = ydata[starts[empty]]
+        self.xs[3, buckets] = xdata[ends]
+        self.ys[3, buckets] = ydata[ends]
+        lower = empty | (ydata[mins] < self.ys[1, buckets])
+        self.xs[1, buckets[lower]] = xdata[mins[lower]]
+        self.ys[1, buckets[lower]] = ydata[mins[lower]]
+        higher = empty | (ydata[maxs] > self.ys[2, buckets])
+        self.xs[2, buckets[higher]] = xdata[maxs[higher]]
+        self.ys[2, buckets[higher]] = ydata[maxs[higher]]
+        self.count[buckets] += ends - starts + 1
+        self.used = max(self.used, buckets[-1] + 1)
+
+    def data(self):
+        """Downsampled x and y arrays in x order"""
+        filled = np.flatnonzero(self.count[:self.used])
+        xs = self.xs[:, filled]
+        ys = self.ys[:, filled]
+        # sort the four points of each bucket by x
+        order = np.argsort(xs, axis=0, kind='mergesort')
+        columns = np.arange(len(filled))
+        xs = xs[order, columns]
+        ys = ys[order, columns]
+        return xs.T.ravel(), ys.T.ravel()
+
+def expand_limits(limits, low, high, headroom=0.5):
+    """Grow axis limits geometrically to cover low..high
+
+    Returns None if limits already cover the range, otherwise new limits
+    where each exceeded side gets headroom times the covered span extra,
+    so a steadily growing series needs only a logarithmic number of
+    rescales.
+    """
+    if not np.isfinite(low) or not np.isfinite(high):
+        return None
+    if limits is not None and low >= limits[0] and high <= limits[1]:
+        return None
+    if limits is None:
+        new_low, new_high = low, high
+    else:
+        new_low, new_high = min(low, limits[0]), max(high, limits[1])
+    span = new_high - new_low
+    if span <= 0:
+        span = max(abs(new_high), 1.0)
+    if limits is None or low < limits[0]:
+        new_low -= headroom * span
+    if limits is None or high > limits[1]:
+        new_high += headroom * span
+    return (new_low, new_high)
@@ -0,0 +1,209 @@
+"""Parallel ensemble trajectory prediction"""
+import threading
+import time
+import multiprocessing
+import multiprocessing.sharedctypes
+import numpy as np
+import pyBalloon.pyb_traj
+
+# model data attached in worker processes
+_MODEL_DATA = None
+# seconds between checks of a closed executor while waiting for members
+POLL_INTERVAL = 0.5
+
+class _SharedArray(object):
+    """NumPy array stored in shared memory"""
+    def __init__(self, array):
+        """Copy array to shared memory"""
+        self.raw = multiprocessing.sharedctypes.RawArray('b',
+                                                        max(array.nbytes, 1))
+        self.dtype = array.dtype.str
+        self.shape = array.shape
+        self.attach()[...] = array
+
+    def attach(self):
+        """Array view of the shared memory"""
+        return np.frombuffer(self.raw, dtype=self.dtype,
+                             count=int(np.prod(self.shape))).reshape(self.shape)
+
+def share(value):
+    """Replace numeric arrays in nested model data with shared copies"""
+    if isinstance(value, np.ndarray) and value.dtype != object:
+        return _SharedArray(value)
+    elif isinstance(value, dict):
+        return dict((key, share(item)) for key, item in value.iteritems())
+    elif isinstance(value, (list, tuple)):
+        return type(value)(share(item) for item in value)
+    return value
+
+def attach(value):
+    """Replace shared arrays in nested model data with array views"""
+    if isinstance(value, _SharedArray):
+        return value.attach()
+    elif isinstance(value, dict):
+        return dict((key, attach(item)) for key, item in value.iteritems())
+    elif isinstance(value, (list, tuple)):
+        return type(value)(attach(item) for item in value)
+    return value
+
+def _init_worker(shared_data):
+    """Attach shared model data in worker process"""
+    global _MODEL_DATA
+    _MODEL_DATA = attach(shared_data)
+
+def _predict_member(task):
+    """Calculate trajectory of one ensemble member in worker process"""
+    index, loc, balloon = task
+    return index, pyBalloon.pyb_traj.calc_movements(_MODEL_DATA[index],
+                                                    loc, balloon)
+
+class PredictionExecutor(object):
+    """Process pool calculating ensemble trajectories with pyBalloon
+
+    The GFS arrays are copied once into shared memory which the forked
+    workers inherit, so a prediction only sends the member index, the
+    start location and the balloon parameters to the workers.
+    """
+    def __init__(self, model_data, workers=0):
+        """Initialise executor, workers=0 uses all cores"""
+        self.model_data = model_data
+        if workers is None or workers <= 0:
+            workers = multiprocessing.cpu_count()
+        self.workers = min(workers, len(model_data))
+        self.pool = None
+        self.closed = False
+        if self.workers > 1:
+            try:
+                self.pool = multiprocessing.Pool(self.workers, _init_worker,
+                                                 (share(model_data),))
+            except (OSError, ValueError):
+                print "Unable to start prediction workers, running serially"
+                self.pool = None
+
+    def predict(self, loc, balloon, callback=None):
+        """Calculate trajectories of all members from loc
+
+        callback(index, trajectory) is called in the calling thread as
+        members finish.  Returns trajectories in member order, None if
+        the executor was closed before all members finished.
+        """
+        trajectories = [None] * len(self.model_data)
+        pool = self.pool
+        if pool is None:
+            results = ((index, pyBalloon.pyb_traj.calc_movements(data, loc,
+                                                                balloon))
+                       for index, data in enumerate(self.model_data))
+        else:
+            tasks = [(index, loc, balloon)
+                     for index in range(len(self.model_data))]
+            results = self._unordered(pool.imap_unordered(_predict_member,
+                                                          tasks), len(tasks))
+        for index, trajectory in results:
+            if self.closed:
+                return None
+            trajectories[index] = trajectory
+            if callback is not None:
+                callback(index, trajectory)
+        if self.closed:
+            return None
+        return trajectories
+
+    def _unordered(self, results, count):
+        """Yield count results of the pool, stop if executor is closed
+
+        Results of a terminated pool never arrive, so they are waited for
+        in steps of POLL_INTERVAL.
+        """
+        for _ in range(count):
+            while True:
+                try:
+                    result = results.next(POLL_INTERVAL)
+                    break
+                except multiprocessing.TimeoutError:
+                    if self.closed:
+                        return
+            yield result
+
+    def close(self):
+        """Stop worker processes, a running predict() returns None"""
+        self.closed = True
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+class PredictionScheduler(threading.Thread):
+    """Background thread re-running predictions from the newest position
+
+    request() only stores the location and returns.  While a prediction
+    is running newer requests replace older pending ones, so the next run
+    always starts from the newest position, and runs are started at most
+    once per min_interval seconds.
+    """
+    def __init__(self, predict, min_interval=0.0):
+        """Initialise scheduler, predict(loc) does the actual work"""
+        threading.Thread.__init__(self, name='PredictionScheduler')
+        self.daemon = True
+        self.predict = predict
+        self.min_interval = min_interval
+        self.runs = 0
+        self.skipped = 0
+        self.last_start = None
+        self._pending = None
+        self._running = True
+        self._condition = threading.Condition()
+
+    def is_active(self):
+        """Check if thread is active"""
+        return self._running
+
+    def request(self, loc):
+        """Request prediction from loc"""
+        self._condition.acquire()
+        if self._pending is not None:
+            self.skipped += 1
+        self._pending = loc
+        self._condition.notify()
+        self._condition.release()
+
+    def exit(self):
+        """Dispose thread, a running prediction is finished first
+
+        Closing the PredictionExecutor ends a running prediction early.
+        """
+        self._condition.acquire()
+        self._running = False
+        self._condition.notify()
+        self._condition.release()
+
+    def _next(self):
+        """Wait for next due request, None when exiting"""
+        self._condition.acquire()
+        try:
+            while self._running:
+                if self._pending is None:
+                    self._condition.wait()
+                    continue
+                if self.last_start is not None:
+                    delay = self.last_start + self.min_interval - time.time()
+                    if delay > 0:
+                        self._condition.wait(delay)
+                        continue
+                loc = self._pending
+                self._pending = None
+                return loc
+            return None
+        finally:
+            self._condition.release()
+
+    def run(self):
+        """Run thread"""
+        print '', self.name, 'started.'
+        while True:
+            loc = self._next()
+            if loc is None:
+                break
+            self.last_start = time.time()
+            self.predict(loc)
+            self.runs += 1
+        print '', self.name, 'ended.'
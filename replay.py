@@ -0,0 +1,154 @@
+"""Replay of recorded APRS log files"""
+import re
+import time
+
+REALTIME, SPEEDUP, FAST = range(3)
+
+# timestamped position reports: DDHHMMz, DDHHMM/ and HHMMSSh
+TIMESTAMP_RE = re.compile(r'^[^:]*:[@/](\d\d)(\d\d)(\d\d)([zh/])')
+FRAME_RE = re.compile(r'^(?:APRS: )?(\S+>\S+:.*)$')
+# packet time wraps: a day for HHMMSSh stamps, a month for DDHHMM ones
+WRAPS = [86400 * days for days in (1, 28, 29, 30, 31)]
+
+def packet_time(tnc2_frame):
+    """Timestamp of an APRS frame in seconds, or None if it has none
+
+    HHMMSSh stamps are returned as seconds of day and DDHHMM stamps as
+    seconds of month, which is enough for pacing a replay.
+    """
+    m = TIMESTAMP_RE.match(tnc2_frame)
+    if not m:
+        return None
+    first, second, third = [int(value) for value in m.group(1, 2, 3)]
+    if m.group(4) == 'h':
+        return first*3600 + second*60 + third
+    return first*86400 + second*3600 + third*60
+
+class ReplaySource(object):
+    """Pace TNC2 frames read from an APRS log file
+
+    In REALTIME mode frames are released according to their own
+    timestamps, in SPEEDUP mode the same schedule runs speed times faster
+    and in FAST mode frames are released as fast as they are consumed.
+    Frames without a timestamp are released together with the previous
+    one.  Lines may be raw TNC2 frames or multimon-ng 'APRS: ' lines.
+    """
+    def __init__(self, filep, mode=REALTIME, speed=1.0, batch=64):
+        """Initialise replay"""
+        self.filep = filep
+        self.mode = mode
+        self.speed = float(speed)
+        if self.mode == REALTIME or self.speed <= 0:
+            self.speed = 1.0
+        self.batch = batch
+        self.finished = False
+        self.packets = 0
+        self.wall_start = None
+        self.wall_end = None
+        self._packet_start = None
+        self._packet_offset = 0.0
+        self._last_time = None
+        self._pending = None
+        self._pending_time = None
+        self._pending_due = None
+
+    def _read_frame(self):
+        """Read next TNC2 frame and its packet time from file"""
+        while True:
+            try:
+                line = self.filep.readline()
+            except IOError:
+                print "IO error"
+                line = ''
+            if line == '':
+                return None, None
+            m = FRAME_RE.match(line.strip())
+            if m:
+                break
+        frame = m.group(1)
+        stamp = packet_time(frame)
+        if stamp is None:
+            return frame, self._last_time
+        if self._last_time is not None:
+            stamp += self._packet_offset
+            if stamp < self._last_time - 43200:
+                # day or month rolled over, only one wrap continues within
+                # a day of the previous frame
+                wraps = [wrap for wrap in WRAPS
+                         if 0 <= stamp + wrap - self._last_time < 86400]
+                if len(wraps) == 0:
+                    # longer gap, released with the previous frame
+                    return frame, self._last_time
+                self._packet_offset += wraps[0]
+                stamp += wraps[0]
+        self._last_time = stamp
+        return frame, stamp
+
+    def _peek(self):
+        """Make sure the next frame, its packet time and due time are known"""
+        if self._pending is not None or self.finished:
+            return
+        frame, stamp = self._read_frame()
+        if frame is None:
+            self.finished = True
+            self.wall_end = time.time()
+            return
+        now = time.time()
+        if self.wall_start is None:
+            self.wall_start = now
+        if self.mode == FAST or stamp is None:
+            due = self.wall_start
+        else:
+            if self._packet_start is None:
+                self._packet_start = stamp
+            due = self.wall_start + (stamp - self._packet_start) / self.speed
+        self._pending = frame
+        self._pending_time = stamp
+        self._pending_due = due
+
+    def timeout(self):
+        """Seconds until next frame is due, None when replay has ended"""
+        self._peek()
+        if self.finished:
+            return None
+        return max(0.0, self._pending_due - time.time())
+
+    def due_frames(self):
+        """Return at most batch frames which are due now and their times
+
+        Packet times are seconds of the day or month of the first frame,
+        unwrapped over roll-overs, and None before the first timestamped
+        frame.
+        """
+        frames = []
+        stamps = []
+        # the first frame sets the start of the replay
+        self._peek()
+        now = time.time()
+        while len(frames) < self.batch:
+            self._peek()
+            if self.finished or self._pending_due > now:
+                break
+            frames.append(self._pending)
+            stamps.append(self._pending_time)
+            self._pending = None
+        self.packets += len(frames)
+        return frames, stamps
+
+    def rate(self):
+        """Replayed packets per second of wall clock time"""
+        if self.wall_start is None:
+            return 0.0
+        end = self.wall_end if self.wall_end is not None else time.time()
+        if end <= self.wall_start:
+            return 0.0
+        return self.packets / (end - self.wall_start)
+
+    def report(self):
+        """Summary of replay throughput"""
+        elapsed = 0.0
+        if self.wall_start is not None:
+            end = self.wall_end if self.wall_end is not None else time.time()
+            elapsed = end - self.wall_start
+        return "Replay: %d packets in %.3f s (%.1f packets/s)" % \
+               (self.packets, elapsed, self.rate())
@@ -0,0 +1,165 @@
+"""Session settings shared by the GUI and the headless daemon"""
+from collections import OrderedDict
+import numpy as np
+import aprs_daemon
+
+# key, title, type, num parameters=0, parameters...
+PARAMETER_SETTINGS = OrderedDict([
+    ('aprs_source',                 ["APRS source",                   "selectint", 3, "SDR", 0, "RS232", 1, "File", 2]),
+    ('aprs_file',                   ["APRS file",                     "string"]),
+    ('replay_mode',                 ["APRS file replay",              "selectint", 3, "Real time", 0, "Speedup", 1, "Fast", 2]),
+    ('replay_speed',                ["Replay speedup",                "double"]),
+    ('update_interval',             ["Update interval (s)",           "int"]),
+    ('callsign',                    ["Callsign",                      "string"]),
+    ('multi_target',                ["Track multiple callsigns",      "bool"]),
+    ('callsigns',                   ["Other callsigns (empty=all)",   "string"]),
+    ('max_targets',                 ["Max targets if callsigns empty", "int"]),
+    ('sdr_freq',                    ["SDR frequency (MHz)",           "double"]),
+    ('sdr_rate',                    ["SDR sample rate (Hz)",          "int"]),
+    ('sdr_gain',                    ["SDR gain",                      "int"]),
+    ('sdr_serial_port',             ["SDR Serial port",               "int"]),
+    ('sdr_serial_rate',             ["SDR Serial baudrate",           "int"]),
+    ('sdr_serial_bytesize',         ["SDR Serial bytesize",           "selectint", 4, "5", 5, "6", 6, "7", 7, "8", 8]),
+    ('sdr_serial_parity',           ["SDR Serial parity",             "selectstring", 5, "None", 'N', "Even", 'E', "Odd", 'O',\
+                                                                                     "Mark", 'M', "Space", 'S']),
+    ('sdr_serial_stopbits',         ["SDR Serial stopbits",           "selectint", 3, "1", 1, "1.5", 1.5, "2", 2]),
+    ('sdr_serial_timeout',          ["SDR Serial timeout",            "int"]),
+    ('sdr_serial_xonxoff',          ["SDR Serial XONXOFF",            "bool"]),
+    ('sdr_serial_rtscts',           ["SDR Serial rtscts",             "bool"]),
+    ('sdr_serial_writetimeout',     ["SDR Serial write timeout",      "int"]),
+    ('sdr_serial_dsrdtr',           ["SDR Serial DSRDTS",             "bool"]),
+    ('sdr_serial_interchartimeout', ["SDR Serial inter char timeout", "int"]),
+    ('raw_file',                    ["Raw data file",                 "string"]),
+    ('data_file',                   ["Parsed data file",              "string"]),
+    ('flight_log',                  ["Binary flight log",             "string"]),
+    ('flight_log_resume',           ["Resume flight from log",        "bool"]),
+    ('history_window',              ["Full resolution window (s)",    "double"]),
+    ('log_queue_size',              ["Log queue size",                "int"]),
+    ('log_flush_interval',          ["Log flush interval (s)",        "double"]),
+    ('log_flush_records',           ["Log flush records",             "int"]),
+    ('log_fsync',                   ["Log fsync",                     "bool"]),
+    ('simulate',                    ["Simulate trajectory",           "bool"]),
+    ('gfs_dir',                     ["GFS directory",                 "string"]),
+    ('gfs_cache_dir',               ["GFS cache directory",           "string"]),
+    ('gfs_cache_size',              ["GFS cache size (MB, 0=off)",    "int"]),
+    ('kml_file',                    ["KML file",                      "string"]),
+    ('kml_export',                  ["Write predictions to KML file", "bool"]),
+    ('prediction_workers',          ["Prediction processes (0=all)",  "int"]),
+    ('prediction_interval',         ["Min. prediction interval (s)",  "double"]),
+    ('descent_predictor',           ["Per-packet landing estimate",   "bool"]),
+    ('descent_band',                ["Wind profile band (m)",         "double"]),
+    ('plot_blit',                   ["Incremental plot redraw",       "bool"]),
+    ('latency_file',                ["Latency statistics file",       "string"]),
+    ('stream_host',                 ["Stream server address",         "string"]),
+    ('stream_port',                 ["Stream server port (0=off)",    "int"]),
+    ('gps',                         ["Enable GPS",                    "bool"]),
+    ('gps_serial_port',             ["GPS Serial port",               "int"]),
+    ('gps_serial_rate',             ["GPS Serial baudrate",           "int"]),
+    ('gps_serial_bytesize',         ["GPS Serial bytesize",           "selectint", 4, "5", 5, "6", 6, "7", 7, "8", 8]),
+    ('gps_serial_parity',           ["GPS Serial parity",             "selectstring", 5, "None", 'N', "Even", 'E', "Odd", 'O',\
+                                                                                     "Mark", 'M', "Space", 'S']),
+    ('gps_serial_stopbits',         ["GPS Serial stopbits",           "selectint", 3, "1", 1, "1.5", 1.5, "2", 2]),
+    ('gps_serial_timeout',          ["GPS Serial timeout",            "int"]),
+    ('gps_serial_xonxoff',          ["GPS Serial XONXOFF",            "bool"]),
+    ('gps_serial_rtscts',           ["GPS Serial rtscts",             "bool"]),
+    ('gps_serial_writetimeout',     ["GPS Serial write timeout",      "int"]),
+    ('gps_serial_dsrdtr',           ["GPS Serial DSRDTS",             "bool"]),
+    ('gps_serial_interchartimeout', ["GPS Serial inter char timeout", "int"])
+])
+
+BALLOON_SETTINGS = OrderedDict([
+    ('lat0',                      ["Latitude (deg)",                "double"]),
+    ('lon0',                      ["Longitude (deg)",               "double"]),
+    ('alt0',                      ["Altitude (m)",                  "double"]),
+    ('altitude_step',             ["Altitude step (m)",             "double"]),
+    ('equip_mass',                ["Equipment mass (kg)",           "double"]),
+    ('balloon_mass',              ["Balloon mass (kg)",             "double"]),
+    ('fill_radius',               ["Fill radius (m)",               "double"]),
+    ('radius_empty',              ["Empty radius (m)",              "double"]),
+    ('burst_radius',              ["Burst radius (m)",              "double"]),
+    ('thickness_empty',           ["Empty thickness (mm)",          "double"]),
+    ('Cd_balloon',                ["Cd balloon",                    "double"]),
+    ('Cd_parachute',              ["Cd parachute",                  "double"]),
+    ('parachute_areas',           ["Parachute areas (m^2)",         "doublelist"]),
+    ("parachute_change_altitude", ["Parachute change altitude (m)", "double"])
+])
+
+def load_session(fname):
+    """Load stored session settings"""
+    try:
+        filep = open(fname, 'r')
+        for line in filep:
+            line = line.strip('\n')
+            if line == "##GENERAL##":
+                params = aprs_daemon.PARAMETERS
+                param_conf = PARAMETER_SETTINGS
+            elif line == "##BALLOON##":
+                params = aprs_daemon.BALLOON
+                param_conf = BALLOON_SETTINGS
+            elif line != "":
+                content = line.split('\t')
+                if param_conf[content[0]][1] == "double":
+                    params[content[0]] =  float(content[1])
+                elif param_conf[content[0]][1] == "int" or \
+                     param_conf[content[0]][1] == "selectint":
+                    if param_conf[content[0]][1] == "int" and \
+                       content[1] == '-1':
+                        params[content[0]] = None
+                    else:
+                        params[content[0]] = int(content[1])
+                elif param_conf[content[0]][1] == "bool":
+                    params[content[0]] = bool(int(content[1]))
+                elif param_conf[content[0]][1] == "doublelist":
+                    values = content[1].split(",")
+                    if content[0] == "parachute_areas":
+                        values = np.pi * np.array([float(values[0]), float(values[1])])**2
+                    params[content[0]] = values
+                else:
+                    params[content[0]] = str(content[1])
+        filep.close()
+    except IOError:
+        print "IOError"
+    except ValueError:
+        print "ValueError"
+    except TypeError:
+        print "TypeError"
+
+def save_session(fname):
+    """Save current session settings"""
+    try:
+        filep = open(fname, 'w')
+        filep.write('##GENERAL##\n')
+        for key in PARAMETER_SETTINGS.keys():
+            if PARAMETER_SETTINGS[key][1] == "bool":
+                filep.write(''.join([key, '\t',
+                        str(int(aprs_daemon.PARAMETERS[key])), '\n']))
+            elif PARAMETER_SETTINGS[key][1] == "int" and \
+                 aprs_daemon.PARAMETERS[key] is None:
+                filep.write(''.join([key, '\t-1\n']))
+            else:
+                filep.write(''.join([key, '\t',
+                            str(aprs_daemon.PARAMETERS[key]), '\n']))
+        filep.write('##BALLOON##\n')
+        for key in BALLOON_SETTINGS.keys():
+            if BALLOON_SETTINGS[key][1] == "bool":
+                filep.write(''.join([key, '\t',
+                            str(int(aprs_daemon.BALLOON[key])), '\n']))
+            elif BALLOON_SETTINGS[key][1] == "int" and \
+                 aprs_daemon.BALLOON[key] is None:
+                filep.write(''.join([key, '\t-1\n']))
+            elif BALLOON_SETTINGS[key][1] == "doublelist":
+                values = aprs_daemon.BALLOON[key]
+                if key == "parachute_areas":
+                    values = [np.sqrt(values[0]/np.pi),
+                              np.sqrt(values[1]/np.pi)]
+                itervalues = iter(values)
+                string = str(next(itervalues))
+                for value in itervalues:
+                    string += ","+str(value)
+                filep.write(''.join([key, '\t', string, '\n']))
+            else:
+                filep.write(''.join([key, '\t',
+                            str(aprs_daemon.BALLOON[key]), '\n']))
+        filep.close()
+    except IOError:
+        print "IO error"
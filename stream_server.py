@@ -0,0 +1,213 @@
+"""Local streaming server for tracker updates"""
+import os
+import socket
+import select
+import threading
+import json
+from collections import OrderedDict, deque
+import numpy as np
+
+# bytes passed to one send() call
+SEND_SIZE = 65536
+
+def jsonable(value):
+    """Convert NumPy values in nested data to JSON types, NaN to None"""
+    if isinstance(value, np.ndarray):
+        value = value.tolist()
+    elif isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float):
+        if value != value or value in (float('inf'), float('-inf')):
+            return None
+        return value
+    elif isinstance(value, dict):
+        return dict((str(key), jsonable(item))
+                    for key, item in value.iteritems())
+    elif isinstance(value, (list, tuple)):
+        return [jsonable(item) for item in value]
+    return value
+
+class StreamServer(threading.Thread):
+    """Thread streaming tracker updates to local clients as JSON lines
+
+    publish() encodes a message once and queues it for every connected
+    client.  Retained messages are also kept and sent first to clients
+    connecting later, so they can build the whole state: with retain=True
+    all such messages are kept in order, with a key only the latest
+    message of that key.  Clients falling more than max_buffer bytes
+    behind are disconnected; the retained messages queued when a client
+    connects do not count, so late clients can catch up on long flights.
+    """
+    def __init__(self, host, port, max_buffer=4*1024**2):
+        """Initialise server thread"""
+        threading.Thread.__init__(self, name='StreamServer')
+        self.daemon = True
+        self.address = (host, port)
+        self.max_buffer = max_buffer
+        self.clients = {}
+        self.history = []
+        self.latest = OrderedDict()
+        self._lock = threading.Lock()
+        self._listener = None
+        self._wake_r, self._wake_w = os.pipe()
+        self._running = True
+
+    def is_active(self):
+        """Check if thread is active"""
+        return self._running
+
+    def publish(self, message, retain=False, key=None):
+        """Queue message for all clients"""
+        try:
+            line = ''.join([json.dumps(jsonable(message)), '\n'])
+        except (TypeError, ValueError):
+            print "Unable to encode stream message"
+            return
+        self._lock.acquire()
+        if retain:
+            self.history.append(line)
+        elif key is not None:
+            self.latest[key] = line
+        for buf in self.clients.itervalues():
+            if not self._slow(buf):
+                buf['data'].append(line)
+                buf['size'] += len(line)
+        self._lock.release()
+        self._wake()
+
+    def clear_retained(self):
+        """Forget retained messages without a key"""
+        self._lock.acquire()
+        self.history = []
+        self._lock.release()
+
+    def exit(self):
+        """Dispose thread"""
+        self._running = False
+        self._wake()
+
+    def _wake(self):
+        """Wake up server loop"""
+        try:
+            os.write(self._wake_w, 'x')
+        except (OSError, TypeError):
+            pass
+
+    def _slow(self, buf):
+        """Check if client has fallen behind, called with lock"""
+        return buf['size'] - buf['backlog'] > self.max_buffer
+
+    def _accept(self):
+        """Accept client and queue retained messages for it
+
+        size counts the unsent bytes of the queued lines and backlog the
+        part of them left of the retained messages.
+        """
+        try:
+            conn, _ = self._listener.accept()
+        except socket.error:
+            return
+        conn.setblocking(0)
+        self._lock.acquire()
+        data = deque(self.history + self.latest.values())
+        size = sum(len(line) for line in data)
+        self.clients[conn] = {'data': data, 'offset': 0, 'size': size,
+                              'backlog': size}
+        self._lock.release()
+
+    def _drop(self, conn):
+        """Disconnect client"""
+        self._lock.acquire()
+        self.clients.pop(conn, None)
+        self._lock.release()
+        try:
+            conn.close()
+        except socket.error:
+            pass
+
+    def _send(self, conn):
+        """Send up to SEND_SIZE bytes of queued data to client
+
+        Lines are only joined up to SEND_SIZE bytes and sent lines are
+        popped off the queue, offset tracking a partly sent first line.
+        """
+        self._lock.acquire()
+        buf = self.clients.get(conn)
+        if buf is None:
+            self._lock.release()
+            return
+        lines = []
+        size = -buf['offset']
+        for line in buf['data']:
+            lines.append(line)
+            size += len(line)
+            if size >= SEND_SIZE:
+                break
+        offset = buf['offset']
+        self._lock.release()
+        try:
+            sent = conn.send(''.join(lines)[offset:])
+        except socket.error:
+            self._drop(conn)
+            return
+        self._lock.acquire()
+        # only this thread removes lines, publish() appends them
+        offset += sent
+        data = buf['data']
+        while data and offset >= len(data[0]):
+            offset -= len(data.popleft())
+        buf['offset'] = offset
+        buf['size'] -= sent
+        buf['backlog'] = max(buf['backlog'] - sent, 0)
+        self._lock.release()
+
+    def run(self):
+        """Run thread"""
+        print '', self.name, 'started.'
+        try:
+            self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._listener.setsockopt(socket.SOL_SOCKET,
+                                      socket.SO_REUSEADDR, 1)
+            self._listener.bind(self.address)
+            self._listener.listen(5)
+            self._listener.setblocking(0)
+        except socket.error:
+            print "Unable to start stream server on %s:%d" % self.address
+            self._running = False
+        while self._running:
+            self._lock.acquire()
+            for conn, buf in self.clients.items():
+                if self._slow(buf):
+                    print "Dropping slow stream client"
+                    del self.clients[conn]
+                    conn.close()
+            conns = self.clients.keys()
+            writers = [conn for conn in conns if self.clients[conn]['size']]
+            self._lock.release()
+            try:
+                readable, writable, _ = select.select(
+                    [self._listener, self._wake_r] + conns, writers, [])
+            except select.error:
+                continue
+            for conn in readable:
+                if conn is self._listener:
+                    self._accept()
+                elif conn == self._wake_r:
+                    os.read(self._wake_r, 4096)
+                else:
+                    # clients only listen, closed if recv returns nothing
+                    try:
+                        if not conn.recv(4096):
+                            self._drop(conn)
+                    except socket.error:
+                        self._drop(conn)
+            for conn in writable:
+                self._send(conn)
+        for conn in self.clients.keys():
+            self._drop(conn)
+        if self._listener is not None:
+            self._listener.close()
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+        self._wake_r = self._wake_w = None
+        print '', self.name, 'ended.'
@@ -0,0 +1,130 @@
+#! /usr/bin/python
+"""Synthetic APRS balloon flights for testing and benchmarking
+
+Generates an ascent, burst and parachute descent drifting with a simple
+wind profile, encoded as TNC2 position reports like those in
+test_data2.aprs.  Other stations, duplicates and malformed frames can be
+mixed in.  The same seed always gives the same frames.
+"""
+import sys
+import math
+import random
+
+FEET = 0.3048
+KNOT = 1852.0 / 3600 # m/s
+EARTH_RADIUS = 6371000.0
+SCALE_HEIGHT = 7000.0
+
+def wind(alt):
+    """East and north wind in m/s at altitude, jet stream near 11 km"""
+    jet = 25.0 * math.exp(-((alt - 11000.0) / 4000.0)**2)
+    return 4.0 + jet, 2.0 - 0.3 * jet
+
+def flight(interval=5.0, alt0=100.0, burst_altitude=30000.0,
+           ascent_rate=5.0, descent_rate=5.0, lat0=60.1, lon0=25.0):
+    """Positions of a flight every interval seconds until landing
+
+    Yields time, lat, lon, altitude, course (deg) and speed (m/s).  The
+    descent rate is given at sea level and grows with thinning air.
+    """
+    time, lat, lon, alt = 0.0, lat0, lon0, alt0
+    rising = True
+    while True:
+        east, north = wind(alt)
+        course = math.degrees(math.atan2(east, north)) % 360
+        yield time, lat, lon, alt, course, math.hypot(east, north)
+        if not rising and alt <= alt0:
+            return
+        if rising:
+            alt += ascent_rate * interval
+            if alt >= burst_altitude:
+                alt = burst_altitude
+                rising = False
+        else:
+            alt -= descent_rate * math.exp(alt / (2 * SCALE_HEIGHT)) * \
+                   interval
+            alt = max(alt, alt0)
+        lat += math.degrees(north * interval / EARTH_RADIUS)
+        lon += math.degrees(east * interval / EARTH_RADIUS /
+                            math.cos(math.radians(lat)))
+        time += interval
+
+def _coordinate(value, width, positive, negative):
+    """Format degrees as APRS DDMM.mm or DDDMM.mm"""
+    hemisphere = positive if value >= 0 else negative
+    value = abs(value)
+    degrees = int(value)
+    minutes = (value - degrees) * 60
+    return '%0*d%05.2f%s' % (width, degrees, minutes, hemisphere)
+
+def position_frame(callsign, seconds, lat, lon, alt, course, speed):
+    """TNC2 position report with HHMMSSh timestamp and altitude"""
+    seconds = int(seconds) % 86400
+    return '%s>APRS:@%02d%02d%02dh%s/%sO%03d/%03d/A=%06d' % (
+        callsign, seconds // 3600, seconds // 60 % 60, seconds % 60,
+        _coordinate(lat, 2, 'N', 'S'), _coordinate(lon, 3, 'E', 'W'),
+        int(round(course)) % 360 or 360, min(int(round(speed / KNOT)), 999),
+        max(int(round(alt / FEET)), 0))
+
+def malformed_frame(frame, rand):
+    """Corrupted copy of a frame"""
+    kind = rand.randrange(4)
+    if kind == 0:
+        # truncated
+        return frame[:rand.randrange(1, len(frame))]
+    elif kind == 1:
+        # garbled characters
+        chars = list(frame)
+        for _ in range(3):
+            chars[rand.randrange(len(chars))] = chr(rand.randrange(33, 127))
+        return ''.join(chars)
+    elif kind == 2:
+        # missing header
+        return frame[frame.find(':') + 1:]
+    return frame.replace('/', '', 1)
+
+def generate(callsign='SYN1-11', interval=5.0, start=9*3600, others=(),
+             other_fraction=0.0, duplicate_fraction=0.0,
+             malformed_fraction=0.0, seed=0, **profile):
+    """List of TNC2 frames of a synthetic flight
+
+    others are callsigns of stations sending fixed position reports
+    among other_fraction of all frames.  duplicate_fraction of frames are
+    repeated as if heard twice via digipeaters and malformed_fraction are
+    corrupted.  profile arguments are passed to flight().
+    """
+    rand = random.Random(seed)
+    others = list(others)
+    stations = dict((other, (profile.get('lat0', 60.1) + rand.uniform(-1, 1),
+                             profile.get('lon0', 25.0) + rand.uniform(-1, 1)))
+                    for other in others)
+    frames = []
+    for time, lat, lon, alt, course, speed in flight(interval, **profile):
+        frame = position_frame(callsign, start + time, lat, lon, alt, course,
+                               speed)
+        if rand.random() < malformed_fraction:
+            frame = malformed_frame(frame, rand)
+        frames.append(frame)
+        if rand.random() < duplicate_fraction:
+            frames.append(frame)
+        while others and rand.random() < other_fraction:
+            other = rand.choice(others)
+            frames.append(position_frame(other, start + time,
+                                         stations[other][0],
+                                         stations[other][1], 0.0, 0, 0.0))
+    return frames
+
+def write(fname, frames, prefix=False):
+    """Write frames to an APRS log file, optionally as multimon-ng lines"""
+    filep = open(fname, 'w')
+    for frame in frames:
+        if prefix:
+            filep.write('APRS: ')
+        filep.write(frame)
+        filep.write('\n')
+    filep.close()
+
+if __name__ == "__main__":
+    write(sys.argv[1] if len(sys.argv) > 1 else 'synthetic.aprs',
+          generate(others=['OH2XYZ-9', 'OH7ABC'], other_fraction=0.2,
+                   duplicate_fraction=0.05, malformed_fraction=0.02))
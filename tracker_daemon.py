@@ -0,0 +1,147 @@
+#! /usr/bin/python
+"""Headless balloon tracker"""
+import sys
+import time
+import signal
+from importtime import timed, print_report
+with timed('daemon'):
+    import aprs_daemon
+    from session import load_session
+    from stream_server import StreamServer
+    from ensemble_stats import nearest
+
+class TrackerDaemon(object):
+    """Master of DataHandlerThread streaming data instead of showing it
+
+    Every update publishes the new rows of each target as a retained
+    'positions' message with the index of its first row since the flight
+    start, so clients connecting later receive the whole flight.  Rows
+    rolled out of the live stores are sent as a 'history' message of
+    bucket aggregates, which replaces all rows before its offset.  Each
+    time rows are rolled out, the retained messages are rebuilt from the
+    history and the live rows, so they stay bounded too.  Chase vehicle
+    location, the analytic landing estimate, the ensemble landing
+    statistics and the latest prediction are retained as their newest
+    message only.
+    """
+    def __init__(self):
+        """Initialise daemon"""
+        self.server = None
+        if aprs_daemon.PARAMETERS['stream_port']:
+            self.server = StreamServer(aprs_daemon.PARAMETERS['stream_host'],
+                                       aprs_daemon.PARAMETERS['stream_port'])
+        self.datahandler = aprs_daemon.DataHandlerThread(self)
+        self.sent = {}
+        self.histories = {}
+        self.chase = None
+        self.landing = None
+
+    def start(self):
+        """Start serving and collecting data"""
+        if self.server is not None:
+            self.server.start()
+        self.datahandler.start()
+
+    def exit(self):
+        """Stop collecting data and serving"""
+        if self.datahandler.is_alive():
+            self.datahandler.exit()
+            self.datahandler.join()
+        if self.server is not None:
+            self.server.exit()
+            self.server.join()
+
+    def _publish(self, message, retain=False, key=None):
+        """Publish message to stream clients"""
+        if self.server is not None:
+            self.server.publish(message, retain, key)
+
+    def update_data(self):
+        """Publish new positions, called by datahandler thread"""
+        targets = self.datahandler.targets
+        histories = dict((callsign, targets[callsign].history.version)
+                         for callsign in targets.callsigns())
+        if histories != self.histories:
+            self.histories = histories
+            if self.server is not None:
+                self.server.clear_retained()
+            self.sent = {}
+        for callsign in targets.callsigns():
+            target = targets[callsign]
+            data = target.store.snapshot()
+            sent = self.sent.get(callsign)
+            if sent is None or data.offset + len(data) < sent:
+                # new, cleared or rolled out store, resend from history
+                history = target.history.query(
+                    data['timestamps'][0] if len(data) > 0 else None)
+                self._publish({'type': 'history',
+                               'callsign': callsign,
+                               'primary': callsign == targets.primary,
+                               'time0': self.datahandler.time0,
+                               'offset': data.offset,
+                               'rows': history},
+                              retain=True)
+                sent = data.offset
+            start = max(sent - data.offset, 0)
+            if len(data) > start:
+                self._publish({'type': 'positions',
+                               'callsign': callsign,
+                               'primary': callsign == targets.primary,
+                               'time0': self.datahandler.time0,
+                               'start': data.offset + start,
+                               'rows': dict((key, data[key][start:])
+                                            for key in data.keys())},
+                              retain=True)
+            self.sent[callsign] = data.offset + len(data)
+        # unknown values as None, NaN would never compare equal
+        chase = tuple(None if value != value else float(value)
+                      for value in self.datahandler.chase_location())
+        if chase != self.chase:
+            self.chase = chase
+            self._publish({'type': 'chase', 'lat': chase[0],
+                           'lon': chase[1], 'alt': chase[2]}, key='chase')
+
+        landing = self.datahandler.landing
+        if landing is not None and landing != self.landing:
+            self.landing = landing
+            self._publish({'type': 'landing', 'lat': landing[0],
+                           'lon': landing[1], 'time': landing[2]},
+                          key='landing')
+
+    def update_ensemble(self, ensemble):
+        """Publish ensemble landing statistics, called by scheduler thread"""
+        if ensemble is None:
+            return
+        chase = self.datahandler.chase_location()
+        points, distances = nearest(ensemble['points'], chase[0], chase[1])
+        message = dict(ensemble)
+        message.update({'type': 'ensemble',
+                        'nearest': points[0],
+                        'nearest_distance': distances[0]})
+        self._publish(message, key='ensemble')
+
+    def update_prediction(self, trajectories):
+        """Publish predicted trajectories, called by scheduler thread"""
+        self._publish({'type': 'prediction', 'time': time.time(),
+                       'trajectories': trajectories}, key='prediction')
+
+def main():
+    """Run tracker without GUI until interrupted"""
+    fname = 'default.ucl'
+    if len(sys.argv) > 1:
+        fname = sys.argv[1]
+    load_session(fname)
+    daemon = TrackerDaemon()
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    daemon.start()
+    print_report()
+    try:
+        while daemon.datahandler.is_alive():
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.exit()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Export of predicted trajectories to the map and KML"""
+import os
+import numpy as np
+from importtime import lazy_import
+
+def to_geojson(trajectories, max_points=200, digits=5):
+    """Compact GeoJSON FeatureCollection of predicted trajectories
+
+    Each ensemble member becomes a LineString of at most max_points
+    points and a Point at its landing site, with coordinates rounded to
+    digits decimals (about a metre at 5).
+    """
+    features = []
+    for index, trajectory in enumerate(trajectories):
+        if trajectory is None:
+            continue
+        lats = np.asarray(trajectory['lats'], float)
+        lons = np.asarray(trajectory['lons'], float)
+        valid = np.isfinite(lats) & np.isfinite(lons)
+        lats, lons = lats[valid], lons[valid]
+        if len(lats) == 0:
+            continue
+        step = max(1, int(np.ceil(len(lats) / float(max_points))))
+        # keep the landing point however the line is thinned
+        take = np.unique(np.r_[np.arange(0, len(lats), step), len(lats)-1])
+        coordinates = np.round(np.column_stack((lons[take], lats[take])),
+                               digits).tolist()
+        features.append({'type': 'Feature',
+                         'properties': {'member': index},
+                         'geometry': {'type': 'LineString',
+                                      'coordinates': coordinates}})
+        features.append({'type': 'Feature',
+                         'properties': {'member': index, 'landing': True},
+                         'geometry': {'type': 'Point',
+                                      'coordinates': coordinates[-1]}})
+    return {'type': 'FeatureCollection', 'features': features}
+
+def write_kml(fname, trajectories):
+    """Write trajectories as KML with pyBalloon, replacing fname atomically
+
+    The file is written next to fname and renamed over it, so readers
+    never see a partly written file.
+    """
+    pyb_io = lazy_import('pyBalloon.pyb_io', 'simulation')
+    tmp_fname = ''.join([fname, '.tmp'])
+    try:
+        pyb_io.save_kml(tmp_fname, trajectories)
+        os.rename(tmp_fname, fname)
+    except (IOError, OSError):
+        print "Unable to write KML file", fname